@@ -1,8 +1,7 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Query
 from pydantic import BaseModel
-from core.multi_agent_orchestrator import run_multi_agent_system
-from fastapi.responses import JSONResponse
-import asyncio
+from core.multi_agent_orchestrator import run_multi_agent_system, run_multi_agent_system_batch
+from fastapi.responses import ORJSONResponse
 
 router = APIRouter()
 
@@ -11,8 +10,60 @@ class QuestionRequest(BaseModel):
     company_code: str = None
     site_code: str = None
 
+class BatchQuestionRequest(BaseModel):
+    questions: list[str]
+    company_code: str = None
+    site_code: str = None
+
+def build_error_data(result: dict) -> dict:
+    """Shape a failed multi-agent result for the client"""
+    return {
+        "error": result["error"],
+        "code": result.get("code"),
+        "success": False
+    }
+
+def build_response_data(result: dict, company_code: str, site_code: str, sample: int = 0) -> dict:
+    """Shape a successful multi-agent result into the response the frontend expects; ``sample`` > 0 keeps only that many rows"""
+    # Extract components from the result
+    routing_decision = result.get("routing_decision", {})
+    selected_table = result.get("selected_table", "")
+    sql_query = result.get("sql_query", "")
+    data = result.get("data", [])  # New format: data is already structured
+    description = result.get("description", "")
+    
+    # Use the data directly from the result (already structured)
+    processed_data = data if isinstance(data, list) else []
+    row_count = result.get("row_count", len(processed_data))
+    if sample:
+        processed_data = processed_data[:sample]
+    error_messages = result.get("error_messages", [])
+    
+    # Prepare the response
+    return {
+        "success": True,
+        "routing_decision": {
+            "selected_table": routing_decision.get("selected_table", ""),
+            "confidence": routing_decision.get("confidence", ""),
+            "reasoning": routing_decision.get("reasoning", "")
+        },
+        "selected_table": selected_table,
+        "sql_query": sql_query,
+        "data": processed_data,
+        "row_count": row_count,  # Rows returned after the TOP and fetch caps (not the full result size), also when data is sampled
+        "truncated": result.get("truncated", False),  # True when the fetch cap dropped rows
+        "answer": description,  # Changed from "description" to "answer" to match frontend
+        "description": description,  # Keep both for compatibility
+        "error_messages": error_messages,
+        "agent_system": "multi-agent-orchestration",
+        "company_info": {
+            "company_code": company_code,
+            "site_code": site_code
+        }
+    }
+
 @router.post("/multi-agent")
-async def run_multi_agent(request: QuestionRequest):
+async def run_multi_agent(request: QuestionRequest, sample: int = Query(0, ge=0)):
     """
     Process a question using the multi-agent orchestration system.
     
@@ -21,6 +72,9 @@ async def run_multi_agent(request: QuestionRequest):
     2. Table Specialist Agent - Generates SQL for the specific table
     3. Query Executor - Executes the SQL query
     4. Description Agent - Generates business-friendly description of results
+    
+    With ``?sample=N`` only the first N rows are returned in ``data``; ``row_count`` still counts every row returned
+    before sampling. It is capped by TOP and the fetch cap, and ``truncated`` is true when the fetch cap dropped rows.
     """
     try:
         # Process the question through the multi-agent system
@@ -34,52 +88,47 @@ async def run_multi_agent(request: QuestionRequest):
         print(f"SQL Query: {sql_query}")
         
         if "error" in result:
-            return JSONResponse(
-                status_code=400,
-                content={
-                    "error": result["error"],
-                    "success": False
-                }
-            )
+            return ORJSONResponse(status_code=400, content=build_error_data(result))
         
-        # Extract components from the result
-        routing_decision = result.get("routing_decision", {})
-        selected_table = result.get("selected_table", "")
-        sql_query = result.get("sql_query", "")
-        data = result.get("data", [])  # New format: data is already structured
-        description = result.get("description", "")
-        answer = result.get("answer", "")
+        response_data = build_response_data(result, request.company_code, request.site_code, sample)
         
-        # Use the data directly from the result (already structured)
-        processed_data = data if isinstance(data, list) else []
-        error_messages = result.get("error_messages", [])
+        print(f"🤖 Multi-Agent: Final response: {response_data}")
+        return ORJSONResponse(content=response_data)
         
-        # Prepare the response
-        response_data = {
-            "success": True,
-            "routing_decision": {
-                "selected_table": routing_decision.get("selected_table", ""),
-                "confidence": routing_decision.get("confidence", ""),
-                "reasoning": routing_decision.get("reasoning", "")
-            },
-            "selected_table": selected_table,
-            "sql_query": sql_query,
-            "data": processed_data,
-            "answer": description,  # Changed from "description" to "answer" to match frontend
-            "description": description,  # Keep both for compatibility
-            "error_messages": error_messages,
-            "agent_system": "multi-agent-orchestration",
-            "company_info": {
-                "company_code": request.company_code,
-                "site_code": request.site_code
+    except Exception as e:
+        return ORJSONResponse(
+            status_code=500,
+            content={
+                "error": f"Internal server error: {str(e)}",
+                "success": False
             }
-        }
+        )
+
+@router.post("/multi-agent/batch")
+async def run_multi_agent_batch(request: BatchQuestionRequest, sample: int = Query(0, ge=0)):
+    """
+    Process several questions in one request.
+    
+    The questions run concurrently and their descriptions are generated in batched LLM calls.
+    Each entry of ``responses`` carries its own status, so one failed question does not fail the others.
+    ``?sample=N`` limits each entry's ``data`` as for the single-question endpoint.
+    """
+    try:
+        print(f"🤖 Multi-Agent: Processing batch of {len(request.questions)} questions")
+        results = await run_multi_agent_system_batch([
+            {"question": question, "company_code": request.company_code, "site_code": request.site_code}
+            for question in request.questions
+        ])
         
-        print(f"🤖 Multi-Agent: Final response: {response_data}")
-        return JSONResponse(content=response_data)
+        responses = [
+            {"status": 400, "data": build_error_data(result)} if "error" in result
+            else {"status": 200, "data": build_response_data(result, request.company_code, request.site_code, sample)}
+            for result in results
+        ]
+        return ORJSONResponse(content={"responses": responses})
         
     except Exception as e:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={
                 "error": f"Internal server error: {str(e)}",
@@ -90,7 +139,7 @@ async def run_multi_agent(request: QuestionRequest):
 @router.get("/multi-agent/status")
 async def get_multi_agent_status():
     """Get the status of the multi-agent system"""
-    return JSONResponse(content={
+    return ORJSONResponse(content={
         "status": "operational",
         "system": "multi-agent-orchestration",
         "agents": [
@@ -7,7 +7,9 @@ import pandas as pd
 import json
 from pathlib import Path
 import io
+import asyncio
 from core.config import SERVER, DATABASE, USERNAME, PASSWORD
+from core.db_pool import run_db
 
 router = APIRouter()
 
@@ -103,7 +105,8 @@ async def retrieve_schema(
             ORDER BY ORDINAL_POSITION
         """
         
-        results = execute_sql_server_query(query)
+        # pyodbc blocks; run it on the ODBC executor so other requests keep being served
+        results = await run_db(execute_sql_server_query, query)
         
         # Format the schema data
         schema = []
@@ -131,7 +134,7 @@ async def sql_query_executor(request: SqlQueryRequest):
             raise HTTPException(status_code=404, detail=f"Table '{request.table_name}' not found")
         
         # Execute the query
-        results = execute_sql_server_query(request.query)
+        results = await run_db(execute_sql_server_query, request.query)
         
         return {
             "data": results,
@@ -498,7 +501,7 @@ async def get_description(
         SELECT name FROM sysobjects 
         WHERE type='U' AND name='table_descriptions'
         """
-        results = execute_sql_server_query(query)
+        results = await run_db(execute_sql_server_query, query)
         
         if not results:
             return {"description": ""}
@@ -538,11 +541,14 @@ async def describe_table_columns(
             WHERE TABLE_NAME = '{table_name}'
             ORDER BY ORDINAL_POSITION
         """
-        schema_results = execute_sql_server_query(query)
-        
         # Get sample data
         sample_query = f"SELECT TOP 5 * FROM {table_name}"
-        sample_results = execute_sql_server_query(sample_query)
+        
+        # Both queries run concurrently on the ODBC executor
+        schema_results, sample_results = await asyncio.gather(
+            run_db(execute_sql_server_query, query),
+            run_db(execute_sql_server_query, sample_query)
+        )
         
         # For now, return a basic description based on schema
         description = f"Table {table_name} contains the following columns:\n"
@@ -612,7 +618,7 @@ async def get_companies():
         ORDER BY CompanyCode, SiteCode
         """
         
-        results = execute_sql_server_query(query)
+        results = await run_db(execute_sql_server_query, query)
         
         companies = []
         for row in results:
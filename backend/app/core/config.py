@@ -13,4 +13,7 @@ AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT", AZURE_OPENAI_ENDPOINT
 AZURE_OPENAI_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", AZURE_OPENAI_DEPLOYMENT_NAME)
 AZURE_OPENAI_DEPLOYMENT_NAME_DESCRIPTION = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME_DESCRIPTION", AZURE_OPENAI_DEPLOYMENT_NAME_DESCRIPTION)
 AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_KEY", AZURE_OPENAI_KEY)
-API_VERSION_GA = os.getenv("API_VERSION_GA", API_VERSION_GA)
\ No newline at end of file
+API_VERSION_GA = os.getenv("API_VERSION_GA", API_VERSION_GA)
+
+# Optional: embedding deployment for the semantic response cache (disabled when empty)
+AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "")
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import pyodbc
+from core.config import SERVER, DATABASE, USERNAME, PASSWORD
+
+# Let the ODBC driver manager reuse physical connections as well
+pyodbc.pooling = True
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+
+# Connections opened at startup so the first requests do not pay for the TCP/TLS/login handshake
+POOL_MIN_SIZE = min(int(os.getenv("DB_POOL_MIN_SIZE", "4")), POOL_SIZE)
+
+# Dedicated threads for blocking ODBC work; pyodbc releases the GIL while it waits on the server,
+# so connects and queries from concurrent requests overlap instead of queueing on the default executor.
+# One worker per pooled connection lets concurrency scale with DB_POOL_SIZE rather than a fixed thread count.
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(POOL_SIZE)))
+_DB_EXECUTOR = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="odbc")
+
+# Most recently returned connection is reused first, so idle ones age out together
+_POOL = queue.LifoQueue(maxsize=POOL_SIZE)
+
+def get_sql_server_connection_string():
+    """Get SQL Server connection string"""
+    return (
+        f"DRIVER={{ODBC Driver 18 for SQL Server}};"
+        f"SERVER={SERVER};DATABASE={DATABASE};"
+        f"UID={USERNAME};PWD={PASSWORD};TrustServerCertificate=yes;"
+    )
+
+def _connect() -> pyodbc.Connection:
+    """Open a new SQL Server connection; autocommit so read-only queries never hold a transaction open"""
+    return pyodbc.connect(get_sql_server_connection_string(), autocommit=True)
+
+def _is_alive(conn: pyodbc.Connection) -> bool:
+    """Check that a pooled connection still answers a trivial query"""
+    try:
+        conn.execute("SELECT 1").fetchone()
+        return True
+    except pyodbc.Error:
+        return False
+
+def checkout(validate: bool = False) -> pyodbc.Connection:
+    """Take a live SQL Server connection from the pool, opening one if the pool is empty.
+    
+    With ``validate`` a pooled connection is pinged first and replaced if the server dropped it.
+    The caller owns the connection until it is handed to ``checkin`` or ``adopt``.
+    """
+    try:
+        conn = _POOL.get_nowait()
+        if validate and not _is_alive(conn):
+            conn.close()
+            conn = _connect()
+    except queue.Empty:
+        conn = _connect()
+    return conn
+
+def checkin(conn: pyodbc.Connection):
+    """Return a healthy connection to the pool, closing it if the pool is already full"""
+    try:
+        _POOL.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+# Errors raised by a failed statement on a healthy connection; OperationalError, InterfaceError and
+# anything else may mean the link is gone, so those still close the connection
+_STATEMENT_ERRORS = (pyodbc.ProgrammingError, pyodbc.DataError, pyodbc.IntegrityError, pyodbc.NotSupportedError)
+
+@contextmanager
+def adopt(conn: pyodbc.Connection):
+    """Use an already checked-out connection, returning it to the pool afterwards"""
+    try:
+        yield conn
+    except _STATEMENT_ERRORS:
+        # A bad statement (syntax, permissions, conversion) leaves the connection itself usable
+        checkin(conn)
+        raise
+    except Exception:
+        # The connection may be broken; drop it rather than hand it to the next caller
+        conn.close()
+        raise
+    checkin(conn)
+
+@contextmanager
+def acquire(validate: bool = False):
+    """Borrow a live SQL Server connection from the pool for the duration of a with-block"""
+    with adopt(checkout(validate)) as conn:
+        yield conn
+
+async def run_db(fn, *args):
+    """Run a blocking database function on the dedicated ODBC executor"""
+    return await asyncio.get_running_loop().run_in_executor(_DB_EXECUTOR, fn, *args)
+
+async def prewarm(count: int = POOL_MIN_SIZE) -> int:
+    """Open ``count`` connections concurrently and park them in the pool; returns how many were opened"""
+    results = await asyncio.gather(*(run_db(_connect) for _ in range(count)), return_exceptions=True)
+    conns = [conn for conn in results if not isinstance(conn, BaseException)]
+    for conn in conns:
+        checkin(conn)
+    return len(conns)
+
+def shutdown():
+    """Stop the ODBC executor and close every idle pooled connection"""
+    _DB_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    while True:
+        try:
+            _POOL.get_nowait().close()
+        except queue.Empty:
+            break
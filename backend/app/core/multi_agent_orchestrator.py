@@ -1,22 +1,322 @@
+"""
+Multi-agent NL-to-SQL orchestrator: router, table specialist, query executor and description agents.
+
+All work here is async I/O. Run it on uvloop where available: start_server.py starts uvicorn with
+loop="auto", which picks uvloop when it is installed (uvicorn[standard] on Linux/macOS) and the
+default asyncio loop otherwise. Scripts that call run_multi_agent_system via asyncio.run can call
+uvloop.install() first. No changes are needed in this module.
+"""
 import os
+import re
 import asyncio
+import atexit
 import json
-import pyodbc
+import csv
+import io
+import dataclasses
+import decimal
+import hashlib
+import logging
+import functools
+import itertools
+import time
+from dataclasses import dataclass
+from typing import Optional
+import httpx
+import sqlglot
+from sqlglot import exp
+import orjson
+from cachetools import LRUCache, TTLCache
+from openai import AsyncAzureOpenAI
 from semantic_kernel import Kernel
-from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion, AzureChatPromptExecutionSettings
+from semantic_kernel.functions import KernelArguments
 from semantic_kernel.functions.kernel_function_decorator import kernel_function
 from semantic_kernel.agents import ChatCompletionAgent
-from core.config import AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY, API_VERSION_GA, SERVER, DATABASE, USERNAME, PASSWORD, AZURE_OPENAI_DEPLOYMENT_NAME, AZURE_OPENAI_DEPLOYMENT_NAME_DESCRIPTION
-
-# SQL Server connection configuration
-def get_sql_server_connection_string():
-    """Get SQL Server connection string"""
-    return (
-        f"DRIVER={{ODBC Driver 18 for SQL Server}};"
-        f"SERVER={SERVER};DATABASE={DATABASE};"
-        f"UID={USERNAME};PWD={PASSWORD};TrustServerCertificate=yes;"
+from semantic_kernel.contents import ChatHistory, ChatMessageContent
+from core.config import AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY, API_VERSION_GA, AZURE_OPENAI_DEPLOYMENT_NAME, AZURE_OPENAI_EMBEDDING_DEPLOYMENT
+from core.db_pool import acquire, adopt, checkin, checkout, run_db
+from core.semantic_cache import MetaCache, SemanticCache
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of (question, sql, data) items packed into one batched description request
+DESCRIPTION_BATCH_SIZE = int(os.getenv("DESCRIPTION_BATCH_SIZE", "5"))
+
+NO_DATA_MESSAGE = "I don't have data for this query. Please try another question."
+
+# Static description rules; the data, SQL and question for each request travel in the user message
+DESCRIPTION_INSTRUCTIONS = """
+You are a data analyst assistant for Paperchase, a hospitality and restaurant management company.
+
+You will receive the data to analyze, the SQL query that produced it and the user question it answers.
+Your task is to analyze the provided data and generate a clear markdown formatted, concise description of what the data shows.
+
+IMPORTANT RULES:
+- If the data is empty, null, or contains no meaningful information, respond ONLY with: "I don't have data for this query. Please try another question."
+- If the SQL query resulted in an error or no results, respond ONLY with: "I don't have data for this query. Please try another question."
+- If the data shows "No results found" or similar error messages, respond ONLY with: "I don't have data for this query. Please try another question."
+- DO NOT generate any analysis, insights, or descriptions if there's no valid data to analyze
+- Only proceed with analysis if you have actual, meaningful data to work with
+
+DATA FORMAT:
+The data is JSON with the column names under "columns", the first rows under "preview_rows" and whole-result totals under "summary".
+
+DATA ANALYSIS GUIDELINES (ONLY if you have valid data):
+- Focus on key insights and patterns in the data
+- Highlight important metrics, trends, or anomalies
+- Use business-friendly language
+- Keep the description concise, word-to-word, and easy to understand for business users
+- Mention the number of records analyzed, taken from summary.row_count
+- If there are specific columns with interesting values, mention them
+- Provide actionable insights when possible
+- Do not go into too much detail; keep it short and to the point
+
+FIRST CHECK: Is the data empty, null, or contains error messages? If yes, respond with "I don't have data for this query. Please try another question."
+
+If you have valid data, generate a clear, business-focused description of what this data reveals. Focus on insights that would be valuable for restaurant management decisions.
+"""
+
+# Static batch rules; the number of items and their data travel in the user message
+DESCRIPTION_BATCH_INSTRUCTIONS = f"""
+You are a data analyst assistant for Paperchase, a hospitality and restaurant management company.
+
+You will receive numbered items. Each item contains a user question, the SQL query executed and the resulting data.
+For each item, generate a clear markdown formatted, concise description of what the data shows.
+
+IMPORTANT RULES:
+- If an item's data is empty, null, or contains no meaningful information, its description must be ONLY: "{NO_DATA_MESSAGE}"
+- Focus on key insights and patterns, use business-friendly language and mention the number of records analyzed
+- Keep each description short and to the point
+
+RESPONSE FORMAT:
+Return ONLY a JSON object with a "descriptions" array holding exactly one entry per item, in input order:
+{{"descriptions": [{{"description": "..."}}]}}
+"""
+
+# Results with at most this many rows are described by the compact fused answer agent
+FUSED_MAX_ROWS = int(os.getenv("FUSED_MAX_ROWS", "5"))
+
+FUSED_ANSWER_INSTRUCTIONS = f"""
+You are a data analyst assistant for Paperchase, a hospitality and restaurant management company.
+You receive a user question, the SQL query that was executed and its few result rows.
+First check that the rows actually answer the question; if they are empty or meaningless, respond ONLY with: "{NO_DATA_MESSAGE}"
+Otherwise answer the question directly in a short markdown summary using business-friendly language, quoting the key figures.
+"""
+
+# How long cached table schema and sample data stay valid
+SCHEMA_CACHE_TTL_S = float(os.getenv("SCHEMA_CACHE_TTL_S", "3600"))
+
+# Maximum number of cached (table, company, site) specialist agents
+SPECIALIST_CACHE_SIZE = int(os.getenv("SPECIALIST_CACHE_SIZE", "128"))
+
+# Time budget for a whole request, and the cap for the description step within it
+REQUEST_TIMEOUT_S = float(os.getenv("REQUEST_TIMEOUT_S", "90"))
+DESCRIBE_TIMEOUT_S = float(os.getenv("DESCRIBE_TIMEOUT_S", "25"))
+
+def _request_deadline() -> float:
+    """Return the absolute event-loop time by which a request started now must finish"""
+    return asyncio.get_running_loop().time() + REQUEST_TIMEOUT_S
+
+def _stage_deadline(deadline: float = None, stage_timeout: float = None):
+    """Return the earlier of the request deadline and a per-stage timeout, or None for no limit"""
+    candidates = [deadline] if deadline is not None else []
+    if stage_timeout is not None:
+        candidates.append(asyncio.get_running_loop().time() + stage_timeout)
+    return min(candidates) if candidates else None
+
+# Shared HTTP/2 client for every Azure OpenAI service so concurrent agent calls reuse pooled connections
+_http_client = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide HTTP client used for Azure OpenAI requests"""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=128, max_keepalive_connections=64),
+            timeout=httpx.Timeout(60, connect=5)
+        )
+    return _http_client
+
+def create_chat_completion(deployment_name: str) -> AzureChatCompletion:
+    """Create an Azure chat completion service backed by the shared HTTP client"""
+    return AzureChatCompletion(
+        deployment_name=deployment_name,
+        endpoint=AZURE_OPENAI_ENDPOINT,
+        api_key=AZURE_OPENAI_KEY,
+        api_version=API_VERSION_GA,
+        async_client=AsyncAzureOpenAI(
+            azure_endpoint=AZURE_OPENAI_ENDPOINT,
+            api_key=AZURE_OPENAI_KEY,
+            api_version=API_VERSION_GA,
+            http_client=get_http_client()
+        )
     )
 
+# One kernel and chat service shared by every agent; built on first use so importing needs no config
+_kernel = None
+_chat_service = None
+
+def get_chat_service() -> AzureChatCompletion:
+    """Return the process-wide GPT-4o chat completion service"""
+    global _chat_service
+    if _chat_service is None:
+        _chat_service = create_chat_completion(AZURE_OPENAI_DEPLOYMENT_NAME)
+    return _chat_service
+
+def get_kernel() -> Kernel:
+    """Return the process-wide kernel with the GPT-4o chat completion service"""
+    global _kernel
+    if _kernel is None:
+        _kernel = Kernel()
+        _kernel.add_service(get_chat_service())
+    return _kernel
+
+# SQL generation is a single deterministic completion; the token cap bounds runaway responses
+SQL_MAX_TOKENS = int(os.getenv("SQL_MAX_TOKENS", "500"))
+SQL_EXECUTION_SETTINGS = AzureChatPromptExecutionSettings(temperature=0, max_tokens=SQL_MAX_TOKENS)
+
+def token_usage(message) -> dict:
+    """Return prompt and prefix-cached prompt token counts from an agent response, or {} if not reported"""
+    usage = getattr(getattr(message, "inner_content", None), "usage", None)
+    if usage is None:
+        return {}
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "cached_tokens": getattr(details, "cached_tokens", None) or 0
+    }
+
+@dataclass(slots=True)
+class QueryResult:
+    """Result of processing a question; fields left as None are omitted from the response dict"""
+    routing_decision: Optional[dict] = None
+    selected_table: Optional[str] = None
+    sql_query: Optional[str] = None
+    # Columnar result: {"columns": [...], "rows": [[...], ...]} with raw driver values, plus "truncated": True
+    # when FETCH_ROW_CAP cut the rows short
+    data: Optional[dict] = None
+    description: Optional[str] = None
+    error: Optional[str] = None
+    code: Optional[str] = None
+    raw_response: Optional[str] = None
+    user_question: Optional[str] = None
+    sql_token_usage: Optional[dict] = None
+    # True when data is the union of several independent statements executed concurrently
+    merged: Optional[bool] = None
+    
+    def to_dict(self) -> dict:
+        """Convert to the dict shape returned by run_multi_agent_system; data is materialized as records.
+        
+        ``row_count`` is the number of rows returned, after any TOP and fetch cap, not the size of the full result;
+        ``truncated`` is added when the fetch cap dropped rows.
+        """
+        response = {name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+        if self.data is not None:
+            response["data"] = to_records(self.data)
+            response["row_count"] = row_count(self.data)
+            if self.data.get("truncated"):
+                response["truncated"] = True
+        return response
+
+def row_count(data) -> int:
+    """Number of rows in a columnar query result"""
+    return len(data["rows"]) if data else 0
+
+def is_empty_result(data) -> bool:
+    """True when a columnar result has no rows, or a single row whose values are all empty"""
+    rows = data["rows"] if data else []
+    if not rows:
+        return True
+    return len(rows) == 1 and all(value is None or value == "" for value in rows[0])
+
+def to_records(data) -> list:
+    """Materialize a columnar query result as the list of {column: string value} dicts the API returns"""
+    if not data:
+        return []
+    columns = data["columns"]
+    return [
+        {column: "" if value is None else str(value) for column, value in zip(columns, row)}
+        for row in data["rows"]
+    ]
+
+def _compact_for_llm(data) -> str:
+    """Convert a columnar query result into a tab-separated string for the description agent"""
+    if row_count(data) > 0:
+        # csv.writer stringifies cells (None -> "") in C, avoiding a Python-level loop per cell
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, dialect="excel-tab", lineterminator="\n")
+        writer.writerow(data["columns"])
+        writer.writerows(data["rows"])
+        return buffer.getvalue().rstrip("\n")
+    return "No data available"
+
+# The description agent sees this many leading rows plus a summary of the whole result
+DESCRIPTION_PREVIEW_ROWS = int(os.getenv("DESCRIPTION_PREVIEW_ROWS", "20"))
+
+# Above this size the preview is cut down further
+DESCRIPTION_MAX_BYTES = int(os.getenv("DESCRIPTION_MAX_BYTES", str(64 * 1024)))
+
+def _numeric_stats(columns: list, rows: list) -> dict:
+    """Sum, min and max of every numeric column, computed in a single pass over the rows"""
+    stats = {}
+    for row in rows:
+        for column, value in zip(columns, row):
+            if isinstance(value, (int, float, decimal.Decimal)) and not isinstance(value, bool):
+                current = stats.get(column)
+                if current is None:
+                    stats[column] = [value, value, value]
+                else:
+                    current[0] += value
+                    if value < current[1]:
+                        current[1] = value
+                    if value > current[2]:
+                        current[2] = value
+    return {column: {"sum": total, "min": low, "max": high} for column, (total, low, high) in stats.items()}
+
+def _serialize_for_llm(data) -> str:
+    """Serialize a preview of a columnar query result plus whole-result statistics as compact JSON"""
+    if row_count(data) == 0:
+        return "No data available"
+    columns, rows = data["columns"], data["rows"]
+    summary = {"row_count": len(rows), "numeric_stats": _numeric_stats(columns, rows)}
+    preview = rows[:DESCRIPTION_PREVIEW_ROWS]
+    # default=str covers the Decimal and bytes values pyodbc returns; dates serialize natively
+    payload = orjson.dumps({"columns": columns, "preview_rows": preview, "summary": summary}, default=str)
+    if len(payload) > DESCRIPTION_MAX_BYTES and len(preview) > 1:
+        keep = max(1, len(preview) * DESCRIPTION_MAX_BYTES // len(payload))
+        payload = orjson.dumps({"columns": columns, "preview_rows": preview[:keep], "summary": summary}, default=str)
+    return payload.decode()
+
+def _build_batch_input(chunk: list) -> str:
+    """Render numbered sections for a batch of (data, sql_query, user_question) items"""
+    return "\n\n".join(
+        f"### ITEM {index}\n"
+        f"USER QUESTION:\n{item['user_question']}\n\n"
+        f"SQL QUERY EXECUTED:\n{item['sql_query']}\n\n"
+        f"DATA TO ANALYZE:\n{_compact_for_llm(item['data'])}"
+        for index, item in enumerate(chunk, 1)
+    )
+
+# Number of sample rows shown to the table specialist
+SAMPLE_ROWS = 5
+
+# Fixed statement text: SQL Server compiles it once and reuses the plan for every table
+SCHEMA_SQL = (
+    "SELECT COLUMN_NAME, DATA_TYPE, IS_NULLABLE, COLUMN_DEFAULT "
+    "FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = ? ORDER BY ORDINAL_POSITION"
+)
+
+@functools.lru_cache(maxsize=64)
+def _schema_and_sample_sql(table_name: str, limit: int) -> str:
+    """Return the schema + sample batch text for a table, built once so each table always sends identical text"""
+    return f"SET NOCOUNT ON; {SCHEMA_SQL}; {_sample_sql(table_name, limit)};"
+
+def _sample_sql(table_name: str, limit: int) -> str:
+    """Return the sample query for a table; NOLOCK keeps sample reads from blocking on production writers"""
+    return f"SELECT TOP {int(limit)} * FROM dbo.{table_name} WITH (NOLOCK)"
+
 class TableDataManager:
     """Manages table schema and sample data for each table"""
     
@@ -51,98 +351,352 @@ class TableDataManager:
                 'business_context': 'Contains revenue center information like Restaurant, Bar, Terrace, etc.'
             }
         }
+        # Sample queries are precomputed; only these configured tables are ever interpolated into SQL
+        for table_name, config in self.table_configs.items():
+            config['sample_sql'] = _sample_sql(table_name, SAMPLE_ROWS)
+        
+        # Per-table (fetched_at, value) caches; the configured tables rarely change shape
+        self._schema_cache: dict[str, tuple[float, list]] = {}
+        self._sample_cache: dict[tuple[str, int], tuple[float, list]] = {}
+        # Assembled context dicts, so repeat lookups skip both the data caches and the dict build
+        self._context_cache: dict[str, tuple[float, dict]] = {}
+    
+    def refresh(self, table_name: str = None):
+        """Drop cached schema and sample data for one table, or for all tables"""
+        if table_name is None:
+            self._schema_cache.clear()
+            self._sample_cache.clear()
+            self._context_cache.clear()
+            return
+        self._schema_cache.pop(table_name, None)
+        self._context_cache.pop(table_name, None)
+        for key in [key for key in self._sample_cache if key[0] == table_name]:
+            del self._sample_cache[key]
+    
+    def cached_schema(self, table_name: str):
+        """Return the last schema read for a table without touching the database, or None if never read"""
+        cached = self._schema_cache.get(table_name)
+        return cached[1] if cached else None
+    
+    def valid_columns(self, table_name: str):
+        """Return the lower-cased column names of a table from cached data only, or None if its schema was never read"""
+        context = self._cached_context(table_name)
+        if context is not None:
+            return context['valid_columns']
+        schema = self.cached_schema(table_name)
+        return frozenset(col['name'].lower() for col in schema) if schema else None
     
     def get_table_schema(self, table_name: str) -> dict:
-        """Get schema information for a specific table"""
+        """Get schema information for a specific table, served from the TTL cache when fresh"""
+        cached = self._schema_cache.get(table_name)
+        if cached and time.monotonic() - cached[0] < SCHEMA_CACHE_TTL_S:
+            return cached[1]
+        schema = self._query_table_schema(table_name)
+        if schema:
+            self._schema_cache[table_name] = (time.monotonic(), schema)
+        return schema
+
+    def _query_table_schema(self, table_name: str) -> list:
+        """Read schema information for a specific table from INFORMATION_SCHEMA"""
         try:
-            conn_str = get_sql_server_connection_string()
-            conn = pyodbc.connect(conn_str)
-            cursor = conn.cursor()
-            
-            cursor.execute(f"""
-                SELECT 
-                    COLUMN_NAME,
-                    DATA_TYPE,
-                    IS_NULLABLE,
-                    COLUMN_DEFAULT
-                FROM INFORMATION_SCHEMA.COLUMNS 
-                WHERE TABLE_NAME = '{table_name}'
-                ORDER BY ORDINAL_POSITION
-            """)
-            columns = cursor.fetchall()
-            
-            schema = [
-                {
-                    'name': col[0], 
-                    'type': col[1], 
-                    'nullable': col[2], 
-                    'default': col[3]
-                }
-                for col in columns
-            ]
-            
-            cursor.close()
-            conn.close()
-            return schema
+            with acquire() as conn:
+                cursor = conn.cursor()
+                cursor.arraysize = 64
+
+                # Constant, parameterized text so SQL Server reuses one cached plan for every table
+                cursor.execute(SCHEMA_SQL, table_name)
+                columns = cursor.fetchall()
+                cursor.close()
+
+            return self._schema_from_rows(columns)
         except Exception as e:
-            print(f"Error reading schema for {table_name}: {e}")
+            logger.warning("Error reading schema for %s: %s", table_name, e)
             return []
-    
-    def get_table_sample_data(self, table_name: str, limit: int = 5) -> list:
-        """Get sample data for a specific table"""
+
+    def get_table_sample_data(self, table_name: str, limit: int = SAMPLE_ROWS) -> list:
+        """Get sample data for a specific table, served from the TTL cache when fresh"""
+        if table_name not in self.table_configs:
+            raise ValueError(f"Unknown table: {table_name}")
+        key = (table_name, limit)
+        cached = self._sample_cache.get(key)
+        if cached and time.monotonic() - cached[0] < SCHEMA_CACHE_TTL_S:
+            return cached[1]
+        sample_data = self._query_table_sample_data(table_name, limit)
+        if sample_data:
+            self._sample_cache[key] = (time.monotonic(), sample_data)
+        return sample_data
+
+    def _query_table_sample_data(self, table_name: str, limit: int) -> list:
+        """Read the top rows of a specific table"""
         try:
-            conn_str = get_sql_server_connection_string()
-            conn = pyodbc.connect(conn_str)
-            cursor = conn.cursor()
-            
-            cursor.execute(f"SELECT TOP {limit} * FROM dbo.{table_name}")
-            columns = [column[0] for column in cursor.description] if cursor.description else []
-            rows = cursor.fetchall()
-            
-            sample_data = []
-            for row in rows:
-                row_dict = {}
-                for i, value in enumerate(row):
-                    row_dict[columns[i]] = str(value) if value is not None else None
-                sample_data.append(row_dict)
-            
-            cursor.close()
-            conn.close()
-            return sample_data
+            with acquire() as conn:
+                cursor = conn.cursor()
+                # Sized to the sample so the driver fetches it in one buffer
+                cursor.arraysize = int(limit)
+
+                sample_sql = self.table_configs[table_name]['sample_sql'] if limit == SAMPLE_ROWS else _sample_sql(table_name, limit)
+                cursor.execute(sample_sql)
+                columns = [column[0] for column in cursor.description] if cursor.description else []
+                rows = cursor.fetchall()
+                cursor.close()
+
+            return self._sample_from_rows(columns, rows)
         except Exception as e:
-            print(f"Error reading sample data for {table_name}: {e}")
+            logger.warning("Error reading sample data for %s: %s", table_name, e)
             return []
+
+    @staticmethod
+    def _schema_from_rows(columns) -> list:
+        """Convert INFORMATION_SCHEMA.COLUMNS rows into schema dicts"""
+        return [
+            {
+                'name': col[0],
+                'type': col[1],
+                'nullable': col[2],
+                'default': col[3]
+            }
+            for col in columns
+        ]
+
+    @staticmethod
+    def _sample_from_rows(columns: list, rows) -> list:
+        """Convert sample rows into dicts of stringified values"""
+        col_names = tuple(columns)
+        return [dict(zip(col_names, (None if value is None else str(value) for value in row))) for row in rows]
+
+    def warmup_all(self):
+        """Load the schema of every configured table into the cache with a single IN (...) query"""
+        table_names = list(self.table_configs)
+        placeholders = ", ".join("?" for _ in table_names)
+        try:
+            with acquire() as conn:
+                cursor = conn.cursor()
+                cursor.arraysize = 256
+                cursor.execute(
+                    "SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, IS_NULLABLE, COLUMN_DEFAULT "
+                    f"FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME IN ({placeholders}) "
+                    "ORDER BY TABLE_NAME, ORDINAL_POSITION",
+                    *table_names
+                )
+                rows = cursor.fetchall()
+                cursor.close()
+        except Exception as e:
+            logger.warning("Error warming up table schemas: %s", e)
+            return
+        
+        fetched_at = time.monotonic()
+        for table_name, group in itertools.groupby(rows, key=lambda row: row[0]):
+            self._schema_cache[table_name] = (fetched_at, self._schema_from_rows(row[1:] for row in group))
+        logger.info("Warmed schema cache for %d of %d tables", len(self._schema_cache), len(table_names))
     
-    def get_table_context(self, table_name: str) -> dict:
-        """Get complete context for a table including schema, sample data, and business context"""
+    def snapshot(self) -> dict:
+        """Read schema and sample rows for every configured table into a plain dict that can be shipped to other processes"""
+        self.warmup_all()
+        snapshot = {}
+        for table_name in self.table_configs:
+            schema, sample_data = self._fetch_schema_and_sample(table_name)
+            if schema:
+                snapshot[table_name] = {'schema': schema, 'sample_data': sample_data}
+        return snapshot
+    
+    def load_snapshot(self, snapshot: dict):
+        """Seed the schema and sample caches from a snapshot taken by another process; entries start a fresh TTL"""
+        # Monotonic clocks are per process, so entries are stamped with this process's clock
+        loaded_at = time.monotonic()
+        for table_name, entry in snapshot.items():
+            if table_name not in self.table_configs:
+                continue
+            self._schema_cache[table_name] = (loaded_at, entry['schema'])
+            if entry['sample_data']:
+                self._sample_cache[(table_name, SAMPLE_ROWS)] = (loaded_at, entry['sample_data'])
+    
+    def _cached_schema_and_sample(self, table_name: str, limit: int = SAMPLE_ROWS):
+        """Return fresh cached (schema, sample_data) for a table, or None if either needs a database read"""
+        now = time.monotonic()
+        cached_schema = self._schema_cache.get(table_name)
+        cached_sample = self._sample_cache.get((table_name, limit))
+        if (cached_schema and now - cached_schema[0] < SCHEMA_CACHE_TTL_S
+                and cached_sample and now - cached_sample[0] < SCHEMA_CACHE_TTL_S):
+            return cached_schema[1], cached_sample[1]
+        return None
+    
+    def _fetch_schema_and_sample(self, table_name: str, limit: int = SAMPLE_ROWS) -> tuple:
+        """Get schema and sample data for a table, reading both in one batch round-trip on a cache miss"""
         if table_name not in self.table_configs:
-            return None
-        
-        schema = self.get_table_schema(table_name)
-        sample_data = self.get_table_sample_data(table_name)
+            raise ValueError(f"Unknown table: {table_name}")
+        cached = self._cached_schema_and_sample(table_name, limit)
+        if cached:
+            return cached
         
-        return {
+        # Schema already warmed (see warmup_all): only the sample rows need a round-trip
+        cached_schema = self._schema_cache.get(table_name)
+        if cached_schema and time.monotonic() - cached_schema[0] < SCHEMA_CACHE_TTL_S:
+            return cached_schema[1], self.get_table_sample_data(table_name, limit)
+
+        try:
+            with acquire() as conn:
+                cursor = conn.cursor()
+                cursor.arraysize = 64
+                cursor.execute(_schema_and_sample_sql(table_name, limit), table_name)
+                schema_rows = cursor.fetchall()
+                cursor.nextset()
+                sample_columns = [column[0] for column in cursor.description] if cursor.description else []
+                sample_rows = cursor.fetchall()
+                cursor.close()
+        except Exception as e:
+            logger.warning("Error reading schema and sample data for %s: %s", table_name, e)
+            return [], []
+
+        schema = self._schema_from_rows(schema_rows)
+        sample_data = self._sample_from_rows(sample_columns, sample_rows)
+        fetched_at = time.monotonic()
+        if schema:
+            self._schema_cache[table_name] = (fetched_at, schema)
+        if sample_data:
+            self._sample_cache[(table_name, limit)] = (fetched_at, sample_data)
+        return schema, sample_data
+
+    def _build_context(self, table_name: str, schema: list, sample_data: list) -> dict:
+        """Assemble the context dict handed to the table specialist, memoizing it once the schema is known"""
+        context = {
             'table_name': table_name,
             'description': self.table_configs[table_name]['description'],
             'business_context': self.table_configs[table_name]['business_context'],
             'schema': schema,
-            'sample_data': sample_data
+            'sample_data': sample_data,
+            # Lower-cased column names (SQL Server identifiers are case-insensitive) for O(1) validation lookups
+            'valid_columns': frozenset(col['name'].lower() for col in schema)
         }
+        if schema:
+            self._context_cache[table_name] = (time.monotonic(), context)
+        return context
+
+    def _cached_context(self, table_name: str):
+        """Return the memoized context for a table while it is fresh, or None"""
+        cached = self._context_cache.get(table_name)
+        if cached and time.monotonic() - cached[0] < SCHEMA_CACHE_TTL_S:
+            return cached[1]
+        return None
+
+    def get_table_context(self, table_name: str) -> dict:
+        """Get complete context for a table including schema, sample data, and business context"""
+        if table_name not in self.table_configs:
+            return None
+
+        context = self._cached_context(table_name)
+        if context is not None:
+            return context
+        schema, sample_data = self._fetch_schema_and_sample(table_name)
+        return self._build_context(table_name, schema, sample_data)
+
+    async def aget_table_context(self, table_name: str) -> dict:
+        """Get table context without blocking the event loop on the ODBC round-trip"""
+        if table_name not in self.table_configs:
+            return None
+
+        context = self._cached_context(table_name)
+        if context is not None:
+            return context
+        # Cache hits are plain dict reads; only a real ODBC round-trip is worth a worker thread
+        cached = self._cached_schema_and_sample(table_name)
+        if cached:
+            schema, sample_data = cached
+        else:
+            schema, sample_data = await run_db(self._fetch_schema_and_sample, table_name)
+        return self._build_context(table_name, schema, sample_data)
+
+@functools.lru_cache(maxsize=None)
+def get_table_manager() -> TableDataManager:
+    """Return the process-wide TableDataManager, so every caller shares one schema and sample cache"""
+    return TableDataManager()
+
+# Local keyword routing, tried before the router LLM call. Keywords mirror the router prompt's
+# "KEYWORDS FOR ROUTING"; the weights make category/item detail outrank plain totals.
+ROUTING_KEYWORDS = {
+    'Vw_SI_SalesDetails': (2, ['category', 'categories', 'by category', 'sub-category', 'sub-categories', 'subcategory',
+                               'subcategories', 'sub category', 'item', 'items', 'line item', 'line items',
+                               'transaction', 'transactions']),
+    'Vw_SI_SalesSummary': (1, ['total', 'totals', 'summary', 'overview', 'aggregated']),
+    'View_DiscountDetails': (2, ['discount', 'discounts', 'company information', 'company details', 'master data']),
+}
+_KEYWORD_TABLE = {keyword: table for table, (_, keywords) in ROUTING_KEYWORDS.items() for keyword in keywords}
+_ROUTING_RE = re.compile(
+    r"\b(" + "|".join(re.escape(keyword) for keyword in sorted(_KEYWORD_TABLE, key=len, reverse=True)) + r")\b"
+)
+# Questions touching master tables or day parts/revenue centres need the LLM to decide
+_ROUTING_AMBIGUOUS_RE = re.compile(r"\b(day ?parts?|lunch|dinner|revenue cent(?:er|re)s?|names?|list|master)\b")
+_GREETING_RE = re.compile(r"^\s*(hi|hello|hey|good (morning|afternoon|evening))\b[\s!.,]*$")
+
+def route_by_keywords(user_question: str):
+    """Route a question locally by keyword score, or return None when the LLM router should decide"""
+    question = user_question.lower()
+    if _GREETING_RE.match(question):
+        return {"selected_table": "GREETING", "confidence": "high", "reasoning": "Simple greeting"}
+    if _ROUTING_AMBIGUOUS_RE.search(question):
+        return None
+    
+    scores = {}
+    matched = {}
+    for keyword in _ROUTING_RE.findall(question):
+        table = _KEYWORD_TABLE[keyword]
+        scores[table] = scores.get(table, 0) + ROUTING_KEYWORDS[table][0]
+        matched.setdefault(table, []).append(keyword)
+    if not scores:
+        return None
+    
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    if len(ranked) > 1 and ranked[0][1] == ranked[1][1]:
+        return None
+    table = ranked[0][0]
+    return {
+        "selected_table": table,
+        "confidence": "high",
+        "reasoning": f"Matched routing keywords: {', '.join(matched[table])}"
+    }
 
 class RouterAgent:
     """Agent responsible for analyzing user questions and routing to appropriate table agents"""
     
     def __init__(self, table_manager: TableDataManager):
         self.table_manager = table_manager
-        self.kernel = Kernel()
-        self.kernel.add_service(
-            AzureChatCompletion(
-                deployment_name=AZURE_OPENAI_DEPLOYMENT_NAME,
-                endpoint=AZURE_OPENAI_ENDPOINT,
-                api_key=AZURE_OPENAI_KEY
-            )
+        self.kernel = get_kernel()
+        
+        # The router prompt is static, so it is built once and sent byte-identical on every call.
+        # That lets Azure OpenAI reuse its cached prompt prefix; only the question varies, in messages.
+        self._router_prompt = self.generate_router_prompt()
+        self.router_agent = ChatCompletionAgent(
+            kernel=self.kernel,
+            name="TableRouterAgent",
+            instructions=self._router_prompt,
+            arguments=KernelArguments(
+                settings=AzureChatPromptExecutionSettings(
+                    response_format=self.routing_response_format(list(table_manager.table_configs))
+                )
+            ),
+            plugins=[]
         )
     
+    @staticmethod
+    def routing_response_format(table_names: list) -> dict:
+        """JSON schema for structured router output; selected_table is limited to known tables or GREETING"""
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "routing_decision",
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "selected_table": {"type": "string", "enum": [*table_names, "GREETING"]},
+                        "confidence": {"type": "string", "enum": ["high", "medium", "low"]},
+                        "reasoning": {"type": "string"}
+                    },
+                    "required": ["selected_table", "confidence", "reasoning"],
+                    "additionalProperties": False
+                }
+            }
+        }
+    
     def generate_router_prompt(self) -> str:
         """Generate the prompt for the router agent"""
         available_tables = list(self.table_manager.table_configs.keys())
@@ -201,150 +755,71 @@ class RouterAgent:
         - "day part", "lunch", "dinner" → Vw_SI_SalesDetails or Vw_SI_SalesSummary
         - "revenue center", "restaurant", "bar" → Vw_SI_SalesDetails or Vw_SI_SalesSummary
         
-        USER QUESTION: {{user_question}}
-        
-        Analyze the question and return the appropriate table selection in JSON format.
+        Analyze the user's question and return the appropriate table selection in JSON format.
         """
     
     async def route_question(self, user_question: str) -> dict:
         """Route a user question to the appropriate table"""
         try:
-            print(f"\n🔄 ROUTER AGENT: Starting to analyze question: '{user_question}'")
-            
-            router_agent = ChatCompletionAgent(
-                kernel=self.kernel,
-                name="TableRouterAgent",
-                instructions=self.generate_router_prompt(),
-                plugins=[]
-            )
+            local_decision = route_by_keywords(user_question)
+            if local_decision:
+                logger.debug("Router: routed locally to %s (%s)", local_decision['selected_table'], local_decision['reasoning'])
+                return local_decision
             
-            print(f"🔄 ROUTER AGENT: Created router agent, sending question to GPT-4o...")
-            result = await router_agent.get_response(messages=user_question)
+            result = await self.router_agent.get_response(messages=user_question)
             response_content = result.content.content.strip()
-            print(f"🔄 ROUTER AGENT: Raw response from GPT-4o: {response_content}")
             
-            # Parse JSON response
-            try:
-                routing_decision = json.loads(response_content)
-                print(f"🔄 ROUTER AGENT: Successfully parsed JSON response")
-                print(f"🔄 ROUTER AGENT: Selected Table: {routing_decision.get('selected_table', 'N/A')}")
-                print(f"🔄 ROUTER AGENT: Confidence: {routing_decision.get('confidence', 'N/A')}")
-                print(f"🔄 ROUTER AGENT: Reasoning: {routing_decision.get('reasoning', 'N/A')}")
-                return routing_decision
-            except json.JSONDecodeError:
-                print(f"🔄 ROUTER AGENT: JSON parsing failed, trying fallback extraction...")
-                # Fallback: try to extract table name from response
-                for table_name in self.table_manager.table_configs.keys():
-                    if table_name.lower() in response_content.lower():
-                        fallback_decision = {
-                            "selected_table": table_name,
-                            "confidence": "medium",
-                            "reasoning": "Extracted from response text"
-                        }
-                        print(f"🔄 ROUTER AGENT: Fallback - Selected Table: {table_name}")
-                        return fallback_decision
-                
-                # Default to SalesSummary if no clear match
-                default_decision = {
-                    "selected_table": "Vw_SI_SalesSummary",
-                    "confidence": "low",
-                    "reasoning": "Default fallback"
-                }
-                print(f"🔄 ROUTER AGENT: Default fallback - Selected Table: Vw_SI_SalesSummary")
-                return default_decision
-                
+            # The structured-output schema guarantees valid JSON naming a known table
+            routing_decision = json.loads(response_content)
+            routing_decision.update(token_usage(result.content))
+            logger.debug("Router: selected %s (confidence=%s, reasoning=%s)", routing_decision.get('selected_table'),
+                         routing_decision.get('confidence'), routing_decision.get('reasoning'))
+            return routing_decision
+            
         except Exception as e:
-            print(f"🔄 ROUTER AGENT: Error occurred: {e}")
+            logger.warning("Router: error, falling back to Vw_SI_SalesSummary: %s", e)
             error_decision = {
                 "selected_table": "Vw_SI_SalesSummary",
                 "confidence": "low",
                 "reasoning": f"Error occurred: {str(e)}"
             }
-            print(f"🔄 ROUTER AGENT: Error fallback - Selected Table: Vw_SI_SalesSummary")
             return error_decision
 
+# Lookup tables whose sample rows are left out of the specialist prompt
+MASTER_TABLES = frozenset({'DayPartMst', 'PaperchaseCategoryMaster', 'MenuItemCategoryMst', 'RevenueCenterMst'})
+SAMPLE_VALUE_MAX_CHARS = 60
+
+def _compact_sample_json(sample_data: list) -> str:
+    """Serialize sample rows as compact JSON, dropping all-null columns and truncating long values"""
+    if not sample_data:
+        return "[]"
+    columns = [col for col in sample_data[0] if any(row.get(col) is not None for row in sample_data)]
+    rows = [
+        {col: value[:SAMPLE_VALUE_MAX_CHARS] if isinstance(value, str) else value
+         for col in columns
+         for value in (row.get(col),)}
+        for row in sample_data
+    ]
+    return json.dumps(rows, separators=(',', ':'), default=str)
+
+def _format_schema_column(col: dict) -> str:
+    """Format one schema column as a prompt bullet"""
+    nullable_info = " (NOT NULL)" if col['nullable'] == 'NO' else ""
+    default_info = f" (Default: {col['default']})" if col['default'] else ""
+    return f"- {col['name']}: {col['type']}{nullable_info}{default_info}"
+
 class TableSpecialistAgent:
     """Specialized agent for a specific table"""
     
-    def __init__(self, table_name: str, table_context: dict, company_code: str = None, site_code: str = None):
-        self.table_name = table_name
-        self.table_context = table_context
-        self.company_code = company_code
-        self.site_code = site_code
-        print(f"\n🔧 TABLE SPECIALIST AGENT: Created for table '{table_name}'")
-        print(f"🔧 TABLE SPECIALIST AGENT: Company Code: {company_code}")
-        print(f"🔧 TABLE SPECIALIST AGENT: Site Code: {site_code}")
-        print(f"🔧 TABLE SPECIALIST AGENT: Table description: {table_context.get('description', 'N/A')}")
-        print(f"🔧 TABLE SPECIALIST AGENT: Business context: {table_context.get('business_context', 'N/A')}")
-        print(f"🔧 TABLE SPECIALIST AGENT: Schema columns: {len(table_context.get('schema', []))}")
-        print(f"🔧 TABLE SPECIALIST AGENT: Sample data records: {len(table_context.get('sample_data', []))}")
-        
-        self.kernel = Kernel()
-        self.kernel.add_service(
-            AzureChatCompletion(
-                deployment_name=AZURE_OPENAI_DEPLOYMENT_NAME,
-                endpoint=AZURE_OPENAI_ENDPOINT,
-                api_key=AZURE_OPENAI_KEY
-            )
-        )
-    
-    def generate_table_prompt(self) -> str:
-        """Generate the prompt for this table specialist agent using the original comprehensive system message"""
-        schema_info = []
-        for col in self.table_context['schema']:
-            nullable_info = " (NOT NULL)" if col['nullable'] == 'NO' else ""
-            default_info = f" (Default: {col['default']})" if col['default'] else ""
-            schema_info.append(f"- {col['name']}: {col['type']}{nullable_info}{default_info}")
-        
-        sample_data_str = json.dumps(self.table_context['sample_data'], indent=2, default=str)
-        
-        # Company and Site filter clause - only apply if both company_code and site_code are provided
-        company_filter = ""
-        if self.company_code and self.site_code:
-            company_filter = f"""
-            COMPANY AND SITE FILTER:
-            - Company Code: {self.company_code}
-            - Site Code: {self.site_code}
-            - Always filter by CompanyCode = '{self.company_code}' AND SiteCode = '{self.site_code}' in WHERE clause
-            - This ensures data is specific to the selected company and site: {self.company_code}/{self.site_code}
-            - For master tables (DayPartMst, PaperchaseCategoryMaster, MenuItemCategoryMst, RevenueCenterMst), always include CompanyCode and SiteCode filters
-            """
-        elif self.company_code and not self.site_code:
-            company_filter = f"""
-            COMPANY FILTER:
-            - Company Code: {self.company_code}
-            - Site Code: Not selected
-            - Always filter by CompanyCode = '{self.company_code}' in WHERE clause
-            - This ensures data is specific to the selected company: {self.company_code}
-            - For master tables, include CompanyCode filter
-            """
-        else:
-            company_filter = """
-            NO COMPANY/SITE FILTER:
-            - No company or site filters will be applied
-            - Query will return data for all companies and sites
-            """
-        
-        return f"""
+    # Rules and patterns shared by every table, sent first so Azure OpenAI can reuse the cached prefix
+    _STATIC_PREFIX = """
         You are a domain-specific SQL assistant for Paperchase, a hospitality and restaurant management company.
 
         You are a SQL expert generating queries specifically for SQL Server (T-SQL). Always follow SQL Server syntax and best practices. Use TOP for row restriction, not LIMIT. Ensure joins are compatible with SQL Server. Use proper SQL Server date functions and data types.
 
         CRITICAL: You must return ONLY SQL queries. NO explanations, NO markdown, NO comments, NO descriptive text.
 
-        You have access to the following SQL Server table in the DataWarehouseV2_UK database:
-
-        Table: {self.table_name} - Contains {len(self.table_context['schema'])} column(s)
-        Description: {self.table_context['description']}
-        Business Context: {self.table_context['business_context']}
-
-        ACTUAL TABLE COLUMNS (based on real database schema):
-        {chr(10).join(schema_info)}
-
-        SAMPLE DATA (for reference):
-        {sample_data_str}
-
-        {company_filter}
+        In the rules and patterns below, <table> stands for the table described in the TABLE CONTEXT section at the end.
 
         ### MSSQL Query Rules:  
         # always use MSSQL query syntax.
@@ -365,8 +840,6 @@ class TableSpecialistAgent:
         # Never use NULLIF() function
 
         ### SQL Constraints:
-        {f"# CompanyCode = '{self.company_code}'" if self.company_code else "# No company filter"}
-        {f"# SiteCode = '{self.site_code}'" if self.site_code else "# No site filter"}
         # always use SQL Server query syntax
         # always use year column in select if its used in where condition
         # never use 'STR_TO_DATE' function as its not available for MSSQL
@@ -402,7 +875,7 @@ class TableSpecialistAgent:
         # DayPart values: Lunch, Dinner, All Day, etc.
         # RevenueCenter values: Restaurant, Bar, Terrace, Room Service, etc.
 
-        ### AVAILABLE COLUMNS FOR {self.table_name}:
+        ### AVAILABLE COLUMNS FOR <table>:
         # CheckId - Transaction identifier
         # Date - Transaction date
         # Month - Month name (January, February, etc.)
@@ -417,7 +890,6 @@ class TableSpecialistAgent:
         # HouseTipsAmount - House tips
         # SiteCode - Site identifier
         # CompanyCode - Company identifier
-        {f"# CategoryId - Category identifier (for joining with master tables)" if self.table_name == 'Vw_SI_SalesDetails' else "# CategoryId - Not available in this table"}
 
         ### AVAILABLE MASTER TABLES FOR INNER JOIN:
         # dbo.DayPartMst - Contains DayPartName (Lunch, Dinner, All Day, etc.)
@@ -430,8 +902,6 @@ class TableSpecialistAgent:
         ### INNER JOIN PATTERNS:
         # When you need DayPartName: INNER JOIN dbo.DayPartMst dp ON main.DayPart = dp.DayPart
         # When you need RevenueCenterName: INNER JOIN dbo.RevenueCenterMst rcm ON main.RevenueCenter = rcm.RevenueCenter
-        {f"# When you need CategoryName: INNER JOIN dbo.Vw_SI_CategoryDetails cd ON main.CategoryId = cd.CategoryId" if self.table_name == 'Vw_SI_SalesDetails' else "# CategoryName joins not available for this table (CategoryId column not present)"}
-        {f"# When you need SubCategoryName: INNER JOIN dbo.MenuItemCategoryMst micm ON main.CategoryId = micm.CategoryId" if self.table_name == 'Vw_SI_SalesDetails' else "# SubCategoryName joins not available for this table (CategoryId column not present)"}
 
         SQL GENERATION RULES:
         - ALWAYS limit results to the latest 100 records using TOP 100 at the end of every query
@@ -447,8 +917,6 @@ class TableSpecialistAgent:
         - When user asks for DayPartName, CategoryName, SubCategoryName, or RevenueCenterName, use INNER JOIN with master tables
         - For DayPartName: INNER JOIN dbo.DayPartMst dp ON main.DayPart = dp.DayPart
         - For RevenueCenterName: INNER JOIN dbo.RevenueCenterMst rcm ON main.RevenueCenter = rcm.RevenueCenter
-        {f"- For CategoryName: INNER JOIN dbo.Vw_SI_CategoryDetails cd ON main.CategoryId = cd.CategoryId" if self.table_name == 'Vw_SI_SalesDetails' else "- CategoryName joins not available for this table (CategoryId column not present)"}
-        {f"- For SubCategoryName: INNER JOIN dbo.MenuItemCategoryMst micm ON main.CategoryId = micm.CategoryId" if self.table_name == 'Vw_SI_SalesDetails' else "- SubCategoryName joins not available for this table (CategoryId column not present)"}
         - CRITICAL: Use Vw_SI_CategoryDetails for category joins
         
         MONTH COMPARISON RULES:
@@ -477,26 +945,21 @@ class TableSpecialistAgent:
         - Use proper SQL Server window functions when needed
 
         COMMON QUERY PATTERNS:
-        - Basic data retrieval: SELECT TOP 100 * FROM dbo.{self.table_name}
-        - Filtered queries: SELECT TOP 100 * FROM dbo.{self.table_name} WHERE ColumnName = 'Value'
-        - Aggregation queries: SELECT TOP 100 ColumnName, COUNT(*) FROM dbo.{self.table_name} GROUP BY ColumnName ORDER BY COUNT(*) DESC
-        - Date range queries: SELECT TOP 100 * FROM dbo.{self.table_name} WHERE Date BETWEEN '2024-01-01' AND '2024-12-31'
-        - Sales by DayPart: SELECT TOP 100 DayPart, FORMAT(SUM(NetAmount), 'N0', 'en-GB') AS TotalSales FROM dbo.{self.table_name} GROUP BY DayPart ORDER BY TotalSales DESC
-        - Sales by RevenueCenter: SELECT TOP 100 RevenueCenter, FORMAT(SUM(NetAmount), 'N0', 'en-GB') AS TotalSales FROM dbo.{self.table_name} GROUP BY RevenueCenter ORDER BY TotalSales DESC
+        - Basic data retrieval: SELECT TOP 100 * FROM dbo.<table>
+        - Filtered queries: SELECT TOP 100 * FROM dbo.<table> WHERE ColumnName = 'Value'
+        - Aggregation queries: SELECT TOP 100 ColumnName, COUNT(*) FROM dbo.<table> GROUP BY ColumnName ORDER BY COUNT(*) DESC
+        - Date range queries: SELECT TOP 100 * FROM dbo.<table> WHERE Date BETWEEN '2024-01-01' AND '2024-12-31'
+        - Sales by DayPart: SELECT TOP 100 DayPart, FORMAT(SUM(NetAmount), 'N0', 'en-GB') AS TotalSales FROM dbo.<table> GROUP BY DayPart ORDER BY TotalSales DESC
+        - Sales by RevenueCenter: SELECT TOP 100 RevenueCenter, FORMAT(SUM(NetAmount), 'N0', 'en-GB') AS TotalSales FROM dbo.<table> GROUP BY RevenueCenter ORDER BY TotalSales DESC
         
         MONTH COMPARISON PATTERNS:
-        - Specific month comparison: SELECT TOP 100 Month, FORMAT(SUM(NetAmount), 'N0', 'en-GB') AS TotalSales FROM dbo.{self.table_name} WHERE Month IN ('January', 'February') GROUP BY Month ORDER BY Month
-        - Month-to-month comparison with CASE: SELECT TOP 100 FORMAT(SUM(CASE WHEN Month = 'January' THEN NetAmount ELSE 0 END), 'N0', 'en-GB') AS JanuarySales, FORMAT(SUM(CASE WHEN Month = 'February' THEN NetAmount ELSE 0 END), 'N0', 'en-GB') AS FebruarySales FROM dbo.{self.table_name} WHERE Month IN ('January', 'February')
-        - All months (when requested): SELECT TOP 100 Month, FORMAT(SUM(NetAmount), 'N0', 'en-GB') AS TotalSales FROM dbo.{self.table_name} GROUP BY Month ORDER BY CASE Month WHEN 'January' THEN 1 WHEN 'February' THEN 2 WHEN 'March' THEN 3 WHEN 'April' THEN 4 WHEN 'May' THEN 5 WHEN 'June' THEN 6 WHEN 'July' THEN 7 WHEN 'August' THEN 8 WHEN 'September' THEN 9 WHEN 'October' THEN 10 WHEN 'November' THEN 11 WHEN 'December' THEN 12 END
+        - Specific month comparison: SELECT TOP 100 Month, FORMAT(SUM(NetAmount), 'N0', 'en-GB') AS TotalSales FROM dbo.<table> WHERE Month IN ('January', 'February') GROUP BY Month ORDER BY Month
+        - Month-to-month comparison with CASE: SELECT TOP 100 FORMAT(SUM(CASE WHEN Month = 'January' THEN NetAmount ELSE 0 END), 'N0', 'en-GB') AS JanuarySales, FORMAT(SUM(CASE WHEN Month = 'February' THEN NetAmount ELSE 0 END), 'N0', 'en-GB') AS FebruarySales FROM dbo.<table> WHERE Month IN ('January', 'February')
+        - All months (when requested): SELECT TOP 100 Month, FORMAT(SUM(NetAmount), 'N0', 'en-GB') AS TotalSales FROM dbo.<table> GROUP BY Month ORDER BY CASE Month WHEN 'January' THEN 1 WHEN 'February' THEN 2 WHEN 'March' THEN 3 WHEN 'April' THEN 4 WHEN 'May' THEN 5 WHEN 'June' THEN 6 WHEN 'July' THEN 7 WHEN 'August' THEN 8 WHEN 'September' THEN 9 WHEN 'October' THEN 10 WHEN 'November' THEN 11 WHEN 'December' THEN 12 END
         
         INNER JOIN PATTERNS:
-        - Sales with DayPartName: SELECT TOP 100 main.DayPart, dp.DayPartName, FORMAT(SUM(main.NetAmount), 'N0', 'en-GB') AS TotalSales FROM dbo.{self.table_name} main INNER JOIN dbo.DayPartMst dp ON main.DayPart = dp.DayPart GROUP BY main.DayPart, dp.DayPartName ORDER BY TotalSales DESC
-        - Sales with RevenueCenterName: SELECT TOP 100 main.RevenueCenter, rcm.RevenueCenterName, FORMAT(SUM(main.NetAmount), 'N0', 'en-GB') AS TotalSales FROM dbo.{self.table_name} main INNER JOIN dbo.RevenueCenterMst rcm ON main.RevenueCenter = rcm.RevenueCenter GROUP BY main.RevenueCenter, rcm.RevenueCenterName ORDER BY TotalSales DESC
-        {f"- Sales with CategoryName: SELECT TOP 100 cd.CategoryName, FORMAT(SUM(main.NetAmount), 'N0', 'en-GB') AS TotalNetAmount, FORMAT(SUM(main.GrossAmount), 'N0', 'en-GB') AS TotalGrossAmount, FORMAT(SUM(main.DiscountAmount), 'N0', 'en-GB') AS TotalDiscountAmount, main.Year FROM dbo.{self.table_name} main INNER JOIN dbo.Vw_SI_CategoryDetails cd ON main.CategoryId = cd.CategoryId WHERE main.Year = 2025 AND main.CompanyCode = 'C1587' AND main.SiteCode = 'L2312' GROUP BY cd.CategoryName, main.Year ORDER BY TotalNetAmount DESC" if self.table_name == 'Vw_SI_SalesDetails' else "# CategoryName joins not available for this table"}
-        {f"- Sales with SubCategoryName: SELECT TOP 100 micm.SubCategoryName, FORMAT(SUM(main.NetAmount), 'N0', 'en-GB') AS TotalSales FROM dbo.{self.table_name} main INNER JOIN dbo.MenuItemCategoryMst micm ON main.CategoryId = micm.CategoryId GROUP BY micm.SubCategoryName ORDER BY TotalSales DESC" if self.table_name == 'Vw_SI_SalesDetails' else "# SubCategoryName joins not available for this table"}
-
-        AVAILABLE TABLE:
-        - dbo.{self.table_name}: {self.table_context['description']}
+        - Sales with DayPartName: SELECT TOP 100 main.DayPart, dp.DayPartName, FORMAT(SUM(main.NetAmount), 'N0', 'en-GB') AS TotalSales FROM dbo.<table> main INNER JOIN dbo.DayPartMst dp ON main.DayPart = dp.DayPart GROUP BY main.DayPart, dp.DayPartName ORDER BY TotalSales DESC
+        - Sales with RevenueCenterName: SELECT TOP 100 main.RevenueCenter, rcm.RevenueCenterName, FORMAT(SUM(main.NetAmount), 'N0', 'en-GB') AS TotalSales FROM dbo.<table> main INNER JOIN dbo.RevenueCenterMst rcm ON main.RevenueCenter = rcm.RevenueCenter GROUP BY main.RevenueCenter, rcm.RevenueCenterName ORDER BY TotalSales DESC
 
         MASTER TABLE QUERIES (for reference):
         - DayPartName: SELECT DISTINCT DayPartName FROM dbo.DayPartMst WHERE CompanyCode='C1587' AND SiteCode='L2312'
@@ -531,281 +994,839 @@ class TableSpecialistAgent:
         - For RevenueCenterName, use RevenueCenterName column from dbo.RevenueCenterMst table
 
         EXAMPLE CORRECT OUTPUT:
-        SELECT TOP 100 CheckId, Date, Month, Year FROM dbo.{self.table_name};
+        SELECT TOP 100 CheckId, Date, Month, Year FROM dbo.<table>;
 
         MONTH COMPARISON EXAMPLES:
-        - For "Compare January and February sales": SELECT TOP 100 Month, FORMAT(SUM(NetAmount), 'N0', 'en-GB') AS TotalSales FROM dbo.{self.table_name} WHERE Month IN ('January', 'February') GROUP BY Month ORDER BY Month
-        - For "Sales in March vs April": SELECT TOP 100 FORMAT(SUM(CASE WHEN Month = 'March' THEN NetAmount ELSE 0 END), 'N0', 'en-GB') AS MarchSales, FORMAT(SUM(CASE WHEN Month = 'April' THEN NetAmount ELSE 0 END), 'N0', 'en-GB') AS AprilSales FROM dbo.{self.table_name} WHERE Month IN ('March', 'April')
-        - For "All months sales": SELECT TOP 100 Month, FORMAT(SUM(NetAmount), 'N0', 'en-GB') AS TotalSales FROM dbo.{self.table_name} GROUP BY Month ORDER BY CASE Month WHEN 'January' THEN 1 WHEN 'February' THEN 2 WHEN 'March' THEN 3 WHEN 'April' THEN 4 WHEN 'May' THEN 5 WHEN 'June' THEN 6 WHEN 'July' THEN 7 WHEN 'August' THEN 8 WHEN 'September' THEN 9 WHEN 'October' THEN 10 WHEN 'November' THEN 11 WHEN 'December' THEN 12 END
+        - For "Compare January and February sales": SELECT TOP 100 Month, FORMAT(SUM(NetAmount), 'N0', 'en-GB') AS TotalSales FROM dbo.<table> WHERE Month IN ('January', 'February') GROUP BY Month ORDER BY Month
+        - For "Sales in March vs April": SELECT TOP 100 FORMAT(SUM(CASE WHEN Month = 'March' THEN NetAmount ELSE 0 END), 'N0', 'en-GB') AS MarchSales, FORMAT(SUM(CASE WHEN Month = 'April' THEN NetAmount ELSE 0 END), 'N0', 'en-GB') AS AprilSales FROM dbo.<table> WHERE Month IN ('March', 'April')
+        - For "All months sales": SELECT TOP 100 Month, FORMAT(SUM(NetAmount), 'N0', 'en-GB') AS TotalSales FROM dbo.<table> GROUP BY Month ORDER BY CASE Month WHEN 'January' THEN 1 WHEN 'February' THEN 2 WHEN 'March' THEN 3 WHEN 'April' THEN 4 WHEN 'May' THEN 5 WHEN 'June' THEN 6 WHEN 'July' THEN 7 WHEN 'August' THEN 8 WHEN 'September' THEN 9 WHEN 'October' THEN 10 WHEN 'November' THEN 11 WHEN 'December' THEN 12 END
 
         EXAMPLE INCORRECT OUTPUT:
         To get data from the table, I will generate a query:
-        ### Query: Fetch data from {self.table_name}
-        SELECT TOP 100 CheckId, Date, Month, Year FROM dbo.{self.table_name};
+        ### Query: Fetch data from <table>
+        SELECT TOP 100 CheckId, Date, Month, Year FROM dbo.<table>;
+        """
+    
+    def __init__(self, table_name: str, table_context: dict, company_code: str = None, site_code: str = None):
+        self.table_name = table_name
+        self.table_context = table_context
+        self.company_code = company_code
+        self.site_code = site_code
+        logger.debug("Table specialist created for %s (company=%s, site=%s, columns=%d, sample rows=%d)",
+                     table_name, company_code, site_code, len(table_context.get('schema', [])),
+                     len(table_context.get('sample_data', [])))
+        
+        # The prompt is fixed for the lifetime of this (table, company, site) specialist
+        self._prompt = self._build_prompt()
+    
+    async def generate_sql(self, user_question: str) -> ChatMessageContent:
+        """Ask GPT-4o for SQL answering the question with one direct chat completion (no agent or plugin layer)"""
+        history = ChatHistory(system_message=self._prompt)
+        history.add_user_message(user_question)
+        messages = await get_chat_service().get_chat_message_contents(
+            chat_history=history, settings=SQL_EXECUTION_SETTINGS
+        )
+        return messages[0]
+    
+    def generate_table_prompt(self) -> str:
+        """Return the prompt for this table specialist agent (built once at construction)"""
+        return self._prompt
+    
+    def _build_prompt(self) -> str:
+        """Build the prompt for this table specialist agent, reusing the compiled text when nothing it depends on changed"""
+        # Master tables are tiny lookups the model can infer from the schema, so they get no sample rows
+        if self.table_name in MASTER_TABLES:
+            sample_data_str = "Not included for master tables"
+        else:
+            sample_data_str = _compact_sample_json(self.table_context['sample_data'])
+        
+        schema = tuple(
+            (col['name'], col['type'], col['nullable'], col['default']) for col in self.table_context['schema']
+        )
+        return self._compile_prompt(
+            self.table_name, self.company_code, self.site_code, schema, sample_data_str,
+            self.table_context['description'], self.table_context['business_context']
+        )
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=SPECIALIST_CACHE_SIZE)
+    def _compile_prompt(table_name: str, company_code: str, site_code: str, schema: tuple, sample_data_str: str,
+                        description: str, business_context: str) -> str:
+        """Assemble the full prompt text; memoized on its inputs so rebuilt specialists with an unchanged schema reuse it"""
+        schema_info = "\n".join(
+            _format_schema_column({'name': name, 'type': data_type, 'nullable': nullable, 'default': default})
+            for name, data_type, nullable, default in schema
+        )
+        
+        # Company and Site filter clause - only apply if both company_code and site_code are provided
+        company_filter = ""
+        if company_code and site_code:
+            company_filter = f"""
+            COMPANY AND SITE FILTER:
+            - Company Code: {company_code}
+            - Site Code: {site_code}
+            - Always filter by CompanyCode = '{company_code}' AND SiteCode = '{site_code}' in WHERE clause
+            - This ensures data is specific to the selected company and site: {company_code}/{site_code}
+            - For master tables (DayPartMst, PaperchaseCategoryMaster, MenuItemCategoryMst, RevenueCenterMst), always include CompanyCode and SiteCode filters
+            """
+        elif company_code and not site_code:
+            company_filter = f"""
+            COMPANY FILTER:
+            - Company Code: {company_code}
+            - Site Code: Not selected
+            - Always filter by CompanyCode = '{company_code}' in WHERE clause
+            - This ensures data is specific to the selected company: {company_code}
+            - For master tables, include CompanyCode filter
+            """
+        else:
+            company_filter = """
+            NO COMPANY/SITE FILTER:
+            - No company or site filters will be applied
+            - Query will return data for all companies and sites
+            """
+        
+        return TableSpecialistAgent._STATIC_PREFIX + TableSpecialistAgent._dynamic_suffix(
+            table_name, company_code, site_code, len(schema), schema_info, sample_data_str, company_filter,
+            description, business_context
+        )
+    
+    @staticmethod
+    def _dynamic_suffix(table_name: str, company_code: str, site_code: str, column_count: int, schema_info: str,
+                        sample_data_str: str, company_filter: str, description: str, business_context: str) -> str:
+        """Per-table and per-company part of the prompt, placed after the shared static prefix"""
+        is_details = table_name == 'Vw_SI_SalesDetails'
+        return f"""
+        TABLE CONTEXT:
+        You have access to the following SQL Server table in the DataWarehouseV2_UK database (<table> = dbo.{table_name}):
 
-        INPUT JSON:
-        {{user_question}}
+        Table: {table_name} - Contains {column_count} column(s)
+        Description: {description}
+        Business Context: {business_context}
 
-        SCHEMA DETAILS:
-        {chr(10).join(schema_info)}
+        ACTUAL TABLE COLUMNS (based on real database schema):
+        {schema_info}
+
+        SAMPLE DATA (for reference):
+        {sample_data_str}
+
+        {company_filter}
+
+        ### SQL Constraints for this request:
+        {f"# CompanyCode = '{company_code}'" if company_code else "# No company filter"}
+        {f"# SiteCode = '{site_code}'" if site_code else "# No site filter"}
+
+        ### TABLE-SPECIFIC COLUMNS AND JOINS:
+        {"# CategoryId - Category identifier (for joining with master tables)" if is_details else "# CategoryId - Not available in this table"}
+        {"# When you need CategoryName: INNER JOIN dbo.Vw_SI_CategoryDetails cd ON main.CategoryId = cd.CategoryId" if is_details else "# CategoryName joins not available for this table (CategoryId column not present)"}
+        {"# When you need SubCategoryName: INNER JOIN dbo.MenuItemCategoryMst micm ON main.CategoryId = micm.CategoryId" if is_details else "# SubCategoryName joins not available for this table (CategoryId column not present)"}
+        {f"- Sales with CategoryName: SELECT TOP 100 cd.CategoryName, FORMAT(SUM(main.NetAmount), 'N0', 'en-GB') AS TotalNetAmount, FORMAT(SUM(main.GrossAmount), 'N0', 'en-GB') AS TotalGrossAmount, FORMAT(SUM(main.DiscountAmount), 'N0', 'en-GB') AS TotalDiscountAmount, main.Year FROM dbo.{table_name} main INNER JOIN dbo.Vw_SI_CategoryDetails cd ON main.CategoryId = cd.CategoryId WHERE main.Year = 2025 AND main.CompanyCode = 'C1587' AND main.SiteCode = 'L2312' GROUP BY cd.CategoryName, main.Year ORDER BY TotalNetAmount DESC" if is_details else ""}
+        {f"- Sales with SubCategoryName: SELECT TOP 100 micm.SubCategoryName, FORMAT(SUM(main.NetAmount), 'N0', 'en-GB') AS TotalSales FROM dbo.{table_name} main INNER JOIN dbo.MenuItemCategoryMst micm ON main.CategoryId = micm.CategoryId GROUP BY micm.SubCategoryName ORDER BY TotalSales DESC" if is_details else ""}
+
+        AVAILABLE TABLE:
+        - dbo.{table_name}: {description}
 
         FINAL INSTRUCTION: Return ONLY SQL queries separated by semicolons. NO explanations, NO markdown, NO comments, NO descriptive text, NO analysis, NO summaries, NO bullet points. ONLY executable SQL statements that can be run directly against the database.
         """
 
+# Hard ceiling on rows read from any query, independent of the SQL itself
+FETCH_ROW_CAP = int(os.getenv("FETCH_ROW_CAP", "200"))
+
+# Markdown code fences the model sometimes wraps SQL in
+_FENCE_RE = re.compile(r"```(?:sql)?", re.IGNORECASE)
+
 class QueryExecutorPlugin:
     """Plugin for executing SQL queries"""
     
     @staticmethod
     def __clean_sql_query__(sql_query: str) -> str:
-        return sql_query.replace("```sql", "").replace("```", "").strip()
+        return _FENCE_RE.sub("", sql_query).strip()
     
     @kernel_function(name="execute_query", description="Executes a SQL Server query")
-    async def execute_query(self, sql_query: str) -> str:
-        def run_query():
-            try:
-                print(f"🔍 QUERY EXECUTOR: Starting to execute query: {sql_query}")
-                query = self.__clean_sql_query__(sql_query)
-                print(f"🔍 QUERY EXECUTOR: Cleaned query: {query}")
-                
-                conn_str = get_sql_server_connection_string()
-                print(f"🔍 QUERY EXECUTOR: Connecting to SQL Server...")
-                conn = pyodbc.connect(conn_str)
+    async def execute_query(self, sql_query: str) -> dict:
+        """Execute a query and return a columnar {"columns": [...], "rows": [[...], ...]} result"""
+        return await self.execute_clean_query(self.__clean_sql_query__(sql_query))
+    
+    async def execute_clean_query(self, sql_query: str, conn=None) -> dict:
+        """Execute an already cleaned query, optionally on a connection checked out of the pool (returned afterwards)"""
+        return await run_db(self._run_query, sql_query, conn)
+    
+    def _run_query(self, query: str, conn=None) -> dict:
+        """Blocking query execution, run on the ODBC executor"""
+        try:
+            logger.debug("Query executor: executing %s", query)
+            
+            with (acquire(validate=True) if conn is None else adopt(conn)) as conn:
                 cursor = conn.cursor()
                 
-                print(f"🔍 QUERY EXECUTOR: Executing query...")
+                cursor.arraysize = FETCH_ROW_CAP
                 cursor.execute(query)
                 columns = [column[0] for column in cursor.description] if cursor.description else []
-                rows = cursor.fetchall()
-                print(f"🔍 QUERY EXECUTOR: Query executed. Found {len(rows)} rows with {len(columns)} columns")
+                # Bounded fetch: memory stays capped even when a statement slips through without TOP.
+                # One extra row tells a result cut at the cap apart from one that is exactly the cap long
+                rows = cursor.fetchmany(FETCH_ROW_CAP + 1) if columns else []
+                truncated = len(rows) > FETCH_ROW_CAP
+                if truncated:
+                    rows = rows[:FETCH_ROW_CAP]
+                    logger.warning("Query executor: result truncated at %d rows; TOP was probably missing", FETCH_ROW_CAP)
+                logger.debug("Query executor: %d rows with %d columns", len(rows), len(columns))
                 
                 cursor.close()
-                conn.close()
-                
-                if not rows:
-                    print(f"🔍 QUERY EXECUTOR: No results found")
-                    return []
-                
-                # Convert to structured data (list of dictionaries)
-                result = []
-                for row in rows:
-                    row_dict = {}
-                    for i, column in enumerate(columns):
-                        row_dict[column] = str(row[i]) if row[i] is not None else ""
-                    result.append(row_dict)
-                
-                print(f"🔍 QUERY EXECUTOR: Query completed successfully. Found {len(result)} rows")
-                return result
-            except Exception as e:
-                print(f"🔍 QUERY EXECUTOR: Error executing query: {e}")
-                return []
+            
+            # Columnar result; values stay as driver types and are stringified only when rendered
+            result = {"columns": columns, "rows": [list(row) for row in rows]}
+            if truncated:
+                result["truncated"] = True
+            return result
+        except Exception as e:
+            logger.warning("Query executor: error executing query: %s", e)
+            return {"columns": [], "rows": []}
+
+# A statement is a run of anything but semicolons, where quoted string literals may contain semicolons
+_STATEMENT_RE = re.compile(r"(?:[^;']|'[^']*')+")
+
+def split_statements(sql_query: str) -> list:
+    """Split a semicolon-separated batch into its individual statements"""
+    return [statement.strip() for statement in _STATEMENT_RE.findall(sql_query) if statement.strip()]
+
+# Row cap applied to any top-level SELECT the model generated without TOP
+MAX_RESULT_ROWS = int(os.getenv("MAX_RESULT_ROWS", "100"))
+
+def parse_statements(statements: list) -> list:
+    """Parse each statement as T-SQL; statements sqlglot cannot parse map to None and are left for SQL Server to judge"""
+    trees = []
+    for statement in statements:
+        try:
+            trees.append(sqlglot.parse_one(statement, read="tsql"))
+        except sqlglot.errors.SqlglotError:
+            # Covers tokenizer failures (e.g. an unterminated quote or bracket) as well as parse errors
+            trees.append(None)
+    return trees
+
+def enforce_row_limit(statement: str, tree) -> str:
+    """Return the statement with TOP MAX_RESULT_ROWS injected when it is a plain SELECT with no row limit"""
+    if not isinstance(tree, exp.Select) or tree.args.get("limit") or tree.args.get("fetch"):
+        return statement
+    return tree.limit(MAX_RESULT_ROWS).sql(dialect="tsql")
+
+# Tables the specialist prompts tell the model to join that are not routed to, so have no configured schema
+JOIN_TABLES = frozenset({'Vw_SI_CategoryDetails'})
+
+def find_unknown_identifiers(trees: list, table_manager: "TableDataManager") -> list:
+    """Return tables and columns the parsed statements reference that are absent from the known table schemas.
+    
+    Columns are only checked when every referenced table has a cached schema, so joins to JOIN_TABLES skip them.
+    """
+    known_tables = {name.lower(): name for name in (*table_manager.table_configs, *JOIN_TABLES)}
+    unknown = []
+    for tree in trees:
+        if tree is None:
+            continue
+        
+        cte_names = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+        referenced = set()
+        for table in tree.find_all(exp.Table):
+            name = table.name.lower()
+            if name in cte_names:
+                continue
+            if name in known_tables:
+                referenced.add(known_tables[name])
+            else:
+                unknown.append(f"table {table.name}")
+        
+        column_sets = [table_manager.valid_columns(name) for name in referenced]
+        if not column_sets or any(columns is None for columns in column_sets):
+            continue
+        # SQL Server identifiers are case-insensitive; output aliases may be referenced in ORDER BY and outer queries
+        valid = set().union(*column_sets)
+        valid.update(alias.alias.lower() for alias in tree.find_all(exp.Alias))
+        for column in tree.find_all(exp.Column):
+            if isinstance(column.this, exp.Star):
+                continue
+            if column.name.lower() not in valid:
+                unknown.append(f"column {column.name}")
+    return list(dict.fromkeys(unknown))
+
+def validate_sql(sql_query: str, table_manager: "TableDataManager") -> tuple:
+    """Check cleaned model SQL before execution and enforce the row cap.
+    
+    Returns ``(sql_query, error, code)``; on success ``error`` is None and ``sql_query`` carries any injected TOP.
+    """
+    # Validate that every statement is actually a query and not descriptive text
+    statements = split_statements(sql_query)
+    if not statements or not all(statement.upper().startswith(('SELECT', 'WITH')) for statement in statements):
+        logger.warning("Step 4: response is not valid SQL: %.100s", sql_query)
+        return sql_query, "Generated response is not valid SQL. Please try again.", None
+    
+    # Reject references to unknown tables or columns locally instead of with a failing DB round-trip
+    trees = parse_statements(statements)
+    unknown = find_unknown_identifiers(trees, table_manager)
+    if unknown:
+        logger.warning("Step 4: SQL references unknown identifiers %s: %.100s", unknown, sql_query)
+        return sql_query, f"Generated SQL references unknown {', '.join(unknown)}. Please try again.", "INVALID_SQL"
+    
+    # The prompt asks for TOP 100 but the model sometimes omits it; enforce the cap here
+    limited = [enforce_row_limit(statement, tree) for statement, tree in zip(statements, trees)]
+    if limited != statements:
+        sql_query = ";\n".join(limited)
+        logger.debug("Step 4: added TOP %d to unbounded SQL: %s", MAX_RESULT_ROWS, sql_query)
+    return sql_query, None, None
+
+def merge_results(results: list) -> dict:
+    """Union several columnar results; rows of a result lacking a column get None in that column"""
+    columns = list(dict.fromkeys(column for result in results for column in result["columns"]))
+    positions = {column: index for index, column in enumerate(columns)}
+    rows = []
+    for result in results:
+        if result["columns"] == columns:
+            rows.extend(result["rows"])
+            continue
+        slots = [positions[column] for column in result["columns"]]
+        for row in result["rows"]:
+            merged_row = [None] * len(columns)
+            for slot, value in zip(slots, row):
+                merged_row[slot] = value
+            rows.append(merged_row)
+    merged = {"columns": columns, "rows": rows}
+    if any(result.get("truncated") for result in results):
+        merged["truncated"] = True
+    return merged
+
+def _release_when_ready(conn_task: asyncio.Task):
+    """Return a prefetched connection to the pool once its checkout finishes, for requests that never used it"""
+    def release(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is None:
+            checkin(task.result())
+    conn_task.add_done_callback(release)
+
+# Exact-match result cache for normalized questions (no embedding similarity: near matches can differ in meaning)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "10000"))
+RESULT_CACHE_TTL_S = float(os.getenv("RESULT_CACHE_TTL_S", "300"))
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+
+def normalize_question(question: str) -> str:
+    """Canonicalize a question: lowercase, punctuation stripped, whitespace collapsed"""
+    return " ".join(_PUNCTUATION_RE.sub(" ", question.lower()).split())
+
+def question_cache_key(question: str, company_code: str = None, site_code: str = None) -> str:
+    """Return the result-cache key for a question scoped to a company and site"""
+    return hashlib.sha1(f"{normalize_question(question)}|{company_code or ''}|{site_code or ''}".encode()).hexdigest()
+
+# Generated SQL is reused for longer than results: it is re-executed against live data on every hit
+SQL_CACHE_TTL_S = float(os.getenv("SQL_CACHE_TTL_S", "3600"))
 
-        return await asyncio.to_thread(run_query)
+# Question embeddings kept per (deployment, normalized text); the same text always embeds to the same vector
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+
+# Routing decisions and generated SQL (never answers) persisted across runs, so repeated questions skip both LLM hops.
+# Near duplicates above the threshold reuse only the routing decision; SQL is reused for exact normalized matches only
+META_CACHE_DIR = os.getenv(
+    "META_CACHE_DIR", os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", ".cache"))
+)
+META_CACHE_PATH = os.path.join(META_CACHE_DIR, "meta_cache.json")
+META_CACHE_THRESHOLD = float(os.getenv("META_CACHE_THRESHOLD", "0.92"))
+META_CACHE_TTL_S = float(os.getenv("META_CACHE_TTL_S", "86400"))
+
+def description_cache_key(sql_query: str, data) -> str:
+    """Return the description-cache key for a query and its exact result data"""
+    payload = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha1(f"{sql_query}\n{payload}".encode()).hexdigest()
+
+# Settings every agent kernel needs; checked once when the orchestrator is created
+REQUIRED_AZURE_SETTINGS = {
+    "AZURE_OPENAI_ENDPOINT": AZURE_OPENAI_ENDPOINT,
+    "AZURE_OPENAI_KEY": AZURE_OPENAI_KEY,
+    "AZURE_OPENAI_DEPLOYMENT_NAME": AZURE_OPENAI_DEPLOYMENT_NAME,
+}
 
 class MultiAgentOrchestrator:
     """Main orchestrator for the multi-agent system"""
     
     def __init__(self):
-        self.table_manager = TableDataManager()
+        # Fail fast on missing Azure OpenAI settings instead of on every request
+        missing = [name for name, value in REQUIRED_AZURE_SETTINGS.items() if not value]
+        if missing:
+            raise RuntimeError(f"Missing Azure OpenAI configuration: {', '.join(missing)}")
+        
+        self.table_manager = get_table_manager()
         self.router_agent = RouterAgent(self.table_manager)
         self.query_executor = QueryExecutorPlugin()
         
         # Initialize description kernel
-        self.description_kernel = Kernel()
-        self.description_kernel.add_service(
-            AzureChatCompletion(
-                deployment_name=AZURE_OPENAI_DEPLOYMENT_NAME,
-                endpoint=AZURE_OPENAI_ENDPOINT,
-                api_key=AZURE_OPENAI_KEY,
-                api_version=API_VERSION_GA
-            )
+        self.description_kernel = get_kernel()
+        self.description_agent = ChatCompletionAgent(
+            kernel=self.description_kernel,
+            name="DataDescriptionAgent",
+            instructions=DESCRIPTION_INSTRUCTIONS,
+            plugins=[]
+        )
+        self._specialists: dict[tuple, tuple[float, TableSpecialistAgent]] = {}
+        self._result_cache = TTLCache(maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL_S)
+        self._sql_cache = TTLCache(maxsize=RESULT_CACHE_SIZE, ttl=SQL_CACHE_TTL_S)
+        self._description_cache = TTLCache(maxsize=RESULT_CACHE_SIZE, ttl=SQL_CACHE_TTL_S)
+        self.meta_cache = MetaCache(META_CACHE_PATH, META_CACHE_THRESHOLD, RESULT_CACHE_SIZE, META_CACHE_TTL_S)
+        self.meta_cache.load()
+        atexit.register(self.meta_cache.save)
+        
+        # Question embeddings for near-duplicate meta-cache hits, enabled when an embedding deployment is configured
+        self._embedding_client = AsyncAzureOpenAI(
+            azure_endpoint=AZURE_OPENAI_ENDPOINT,
+            api_key=AZURE_OPENAI_KEY,
+            api_version=API_VERSION_GA,
+            http_client=get_http_client()
+        ) if AZURE_OPENAI_EMBEDDING_DEPLOYMENT else None
+        self._embedding_cache = LRUCache(maxsize=EMBEDDING_CACHE_SIZE)
+        self._specialist_locks: dict[tuple, asyncio.Lock] = {}
+        self.batch_description_agent = ChatCompletionAgent(
+            kernel=self.description_kernel,
+            name="DataDescriptionBatchAgent",
+            instructions=DESCRIPTION_BATCH_INSTRUCTIONS,
+            arguments=KernelArguments(
+                settings=AzureChatPromptExecutionSettings(response_format={"type": "json_object"})
+            ),
+            plugins=[]
+        )
+        self.fused_answer_agent = ChatCompletionAgent(
+            kernel=self.description_kernel,
+            name="FusedAnswerAgent",
+            instructions=FUSED_ANSWER_INSTRUCTIONS,
+            plugins=[]
         )
     
-    async def process_question(self, user_question: str, company_code: str = None, site_code: str = None) -> dict:
-        """Process a user question through the multi-agent system"""
+    async def embed_question(self, user_question: str):
+        """Embed a question for the meta cache, or return None if embeddings are disabled or embedding fails"""
+        if self._embedding_client is None:
+            return None
+        text = " ".join(user_question.lower().split())
+        key = (AZURE_OPENAI_EMBEDDING_DEPLOYMENT, text)
+        embedding = self._embedding_cache.get(key)
+        if embedding is not None:
+            return embedding
         try:
-            print(f"\n🚀 MULTI-AGENT ORCHESTRATOR: Starting to process question: '{user_question}'")
-            print(f"🚀 MULTI-AGENT ORCHESTRATOR: Company Code: {company_code}")
-            print(f"🚀 MULTI-AGENT ORCHESTRATOR: Site Code: {site_code}")
-            
-            # Step 1: Route the question to appropriate table
-            print(f"\n📋 STEP 1: ROUTING - Calling Router Agent...")
-            routing_result = await self.router_agent.route_question(user_question)
-            selected_table = routing_result['selected_table']
-            print(f"📋 STEP 1: ROUTING - Router Agent completed. Selected table: {selected_table}")
+            response = await self._embedding_client.embeddings.create(model=AZURE_OPENAI_EMBEDDING_DEPLOYMENT, input=text)
+            embedding = SemanticCache.normalize(response.data[0].embedding)
+            # Shared by every caller of the same text, so it must never be modified in place
+            embedding.setflags(write=False)
+            self._embedding_cache[key] = embedding
+            return embedding
+        except Exception as e:
+            logger.warning("Meta cache: embedding failed, skipping near-duplicate lookup: %s", e)
+            return None
+    
+    async def get_specialist(self, table_name: str, company_code: str = None, site_code: str = None):
+        """Return a cached TableSpecialistAgent for (table, company, site), building it on a miss or after the TTL"""
+        key = (table_name, company_code, site_code)
+        cached = self._specialists.get(key)
+        if cached and time.monotonic() - cached[0] < SCHEMA_CACHE_TTL_S:
+            return cached[1]
+        
+        # One build per key; concurrent requests for the same key wait for it instead of duplicating the work
+        async with self._specialist_locks.setdefault(key, asyncio.Lock()):
+            cached = self._specialists.get(key)
+            if cached and time.monotonic() - cached[0] < SCHEMA_CACHE_TTL_S:
+                return cached[1]
             
-            # Step 2: Get table context
-            print(f"\n📋 STEP 2: TABLE CONTEXT - Getting context for table '{selected_table}'...")
-            table_context = self.table_manager.get_table_context(selected_table)
+            table_context = await self.table_manager.aget_table_context(table_name)
             if not table_context:
-                print(f"❌ STEP 2: TABLE CONTEXT - Error: Table {selected_table} not found or accessible")
-                return {
-                    "error": f"Table {selected_table} not found or accessible",
-                    "routing_decision": routing_result
-                }
-            print(f"✅ STEP 2: TABLE CONTEXT - Successfully retrieved context for table '{selected_table}'")
+                return None
+            specialist = TableSpecialistAgent(table_name, table_context, company_code, site_code)
             
-            # Step 3: Create table specialist agent
-            print(f"\n📋 STEP 3: TABLE SPECIALIST - Creating Table Specialist Agent...")
-            table_agent = TableSpecialistAgent(selected_table, table_context, company_code, site_code)
-            print(f"✅ STEP 3: TABLE SPECIALIST - Table Specialist Agent created successfully")
-            
-            # Step 4: Generate SQL query
-            print(f"\n📋 STEP 4: SQL GENERATION - Creating SQL Agent with your original system message...")
-            sql_agent = ChatCompletionAgent(
-                kernel=table_agent.kernel,
-                name=f"{selected_table}SQLAgent",
-                instructions=table_agent.generate_table_prompt(),
-                plugins=[]
+            self._specialists.pop(key, None)
+            self._specialists[key] = (time.monotonic(), specialist)
+            if len(self._specialists) > SPECIALIST_CACHE_SIZE:
+                # Dicts keep insertion order, so the first key is the least recently built
+                self._specialists.pop(next(iter(self._specialists)))
+            return specialist
+    
+    async def process_question(self, user_question: str, company_code: str = None, site_code: str = None,
+                               deadline: float = None) -> QueryResult:
+        """Process a user question through the multi-agent system, reusing a cached result for the same normalized question.
+        
+        Concurrent identical questions are coalesced once, by the in-flight futures in run_multi_agent_system.
+        The question is embedded only on a result-cache miss, for near-duplicate routing hits in the meta cache.
+        """
+        key = question_cache_key(user_question, company_code, site_code)
+        cached = self._result_cache.get(key)
+        if cached is not None:
+            logger.debug("Orchestrator: result cache hit")
+            return dataclasses.replace(cached)
+        
+        embedding = await self.embed_question(user_question)
+        result = await self._run_pipeline(user_question, company_code, site_code, deadline, embedding)
+        if not result.error:
+            self._result_cache[key] = dataclasses.replace(result)
+        return result
+    
+    async def _run_pipeline(self, user_question: str, company_code: str = None, site_code: str = None, deadline: float = None,
+                            embedding=None) -> QueryResult:
+        """Run all steps for a question: routing, SQL generation, execution and description"""
+        result = await self.generate_and_execute(user_question, company_code, site_code, deadline, embedding)
+        if result.error:
+            return result
+        
+        # Step 6: Generate description; unchanged SQL + data reuses the previous description
+        description_key = description_cache_key(result.sql_query, result.data)
+        description = self._description_cache.get(description_key)
+        if description is not None:
+            logger.debug("Step 6: description cache hit, skipping description model")
+        elif not is_empty_result(result.data) and row_count(result.data) <= FUSED_MAX_ROWS:
+            description = await self.fused_describe(user_question, result.sql_query, result.data, deadline)
+        else:
+            description = await self.generate_data_description(
+                result.data, result.sql_query, user_question, deadline
             )
-            print(f"📋 STEP 4: SQL GENERATION - SQL Agent created, sending question to GPT-4o...")
-            sql_result = await sql_agent.get_response(messages=user_question)
-            sql_query = sql_result.content.content.strip()
-            print(f"📋 STEP 4: SQL GENERATION - Raw SQL response from GPT-4o: {sql_query}")
+        if description != NO_DATA_MESSAGE:
+            self._description_cache[description_key] = description
+        logger.debug("Step 6: description of %d characters: %.100s", len(description), description)
+        
+        result.description = description
+        return result
+    
+    async def generate_and_execute(self, user_question: str, company_code: str = None, site_code: str = None, deadline: float = None,
+                                   embedding=None) -> QueryResult:
+        """Run routing, SQL generation and query execution (steps 1-5) for a user question.
+        
+        ``deadline`` is an absolute event-loop time shared by every stage of the request.
+        ``embedding`` is the question's normalized embedding, if already computed, for near-duplicate meta-cache hits.
+        """
+        conn_task = None
+        try:
+            logger.debug("Orchestrator: processing %r (company=%s, site=%s)", user_question, company_code, site_code)
             
-            # Clean SQL query
-            sql_query = QueryExecutorPlugin.__clean_sql_query__(sql_query)
-            print(f"✅ STEP 4: SQL GENERATION - Cleaned SQL query: {sql_query}")
+            # Step 1 is skipped for a question or near duplicate with a cached route; Step 4 only for the same question
+            meta_key = question_cache_key(user_question, company_code, site_code)
+            meta = self.meta_cache.lookup(meta_key, embedding, (company_code, site_code))
             
-            # Validate that the response is actually SQL and not descriptive text
-            if not sql_query.strip().upper().startswith('SELECT') and not sql_query.strip().upper().startswith('WITH'):
-                print(f"❌ STEP 4: SQL GENERATION - Error: Response is not valid SQL. Got: {sql_query[:100]}...")
-                return {
-                    "error": "Generated response is not valid SQL. Please try again.",
-                    "routing_decision": routing_result,
-                    "selected_table": selected_table,
-                    "raw_response": sql_query
-                }
+            # Step 1: Route the question to appropriate table
+            if meta is not None:
+                routing_result = meta["routing_decision"]
+                logger.debug("Step 1: meta cache hit, skipping router")
+            else:
+                async with asyncio.timeout_at(deadline):
+                    routing_result = await self.router_agent.route_question(user_question)
+            selected_table = routing_result['selected_table']
+            logger.debug("Step 1: routed to %s", selected_table)
             
-            # Validate SQL query against actual table schema
-            valid_columns = [col['name'] for col in table_context['schema']]
-            print(f"✅ STEP 4: SQL GENERATION - Valid columns: {valid_columns}")
+            # Check out (and ping) the Step 5 connection while the specialist and GPT-4o do their work
+            conn_task = asyncio.create_task(run_db(checkout, True))
             
-            # Step 5: Execute the query
-            print(f"\n📋 STEP 5: QUERY EXECUTION - Executing SQL query...")
-            query_result = await self.query_executor.execute_query(sql_query)
-            print(f"📋 STEP 5: QUERY EXECUTION - Query result length: {len(str(query_result))} characters")
-            print(f"📋 STEP 5: QUERY EXECUTION - Query result preview: {str(query_result)[:100]}...")
+            # Steps 2-3: Get table context and the table specialist agent (cached per table/company/site)
+            table_agent = await self.get_specialist(selected_table, company_code, site_code)
+            if not table_agent:
+                logger.warning("Step 2: table %s not found or accessible", selected_table)
+                return QueryResult(
+                    error=f"Table {selected_table} not found or accessible",
+                    routing_decision=routing_result
+                )
+            table_context = table_agent.table_context
             
-            # Step 6: Generate description
-            print(f"\n📋 STEP 6: DESCRIPTION - Generating business description...")
-            description = await self.generate_data_description(
-                query_result, sql_query, user_question
-            )
-            print(f"📋 STEP 6: DESCRIPTION - Description length: {len(description)} characters")
-            print(f"📋 STEP 6: DESCRIPTION - Description preview: {description[:100]}...")
+            # Step 4: Generate SQL query (validated SQL is cached per table/question/company/site)
+            sql_key = (selected_table, normalize_question(user_question), company_code, site_code)
+            sql_query = meta.get("sql_query") if meta is not None else None
+            if sql_query is None:
+                sql_query = self._sql_cache.get(sql_key)
+            sql_token_usage = None
+            if sql_query is not None:
+                logger.debug("Step 4: SQL cache hit, skipping GPT-4o: %s", sql_query)
+            else:
+                async with asyncio.timeout_at(deadline):
+                    sql_message = await table_agent.generate_sql(user_question)
+                sql_query = (sql_message.content or "").strip()
+                sql_token_usage = token_usage(sql_message)
+                logger.debug("Step 4: raw SQL response from GPT-4o: %s", sql_query)
+                
+                # Clean SQL query
+                sql_query = QueryExecutorPlugin.__clean_sql_query__(sql_query)
+                logger.debug("Step 4: cleaned SQL query: %s", sql_query)
+                
+                # Validate statements and identifiers, and cap unbounded SELECTs
+                sql_query, error, code = validate_sql(sql_query, self.table_manager)
+                if error:
+                    return QueryResult(
+                        error=error,
+                        code=code,
+                        routing_decision=routing_result,
+                        selected_table=selected_table,
+                        raw_response=sql_query
+                    )
+                self._sql_cache[sql_key] = sql_query
             
-            print(f"\n🎉 MULTI-AGENT ORCHESTRATOR: All steps completed successfully!")
+            # Validate SQL query against actual table schema; the column list is only built when it will be logged
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Step 4: valid columns: %s", sorted(table_context['valid_columns']))
             
-            return {
-                "routing_decision": routing_result,
-                "selected_table": selected_table,
-                "sql_query": sql_query,
-                "data": query_result,
-                "description": description
-            }
+            # Step 5: Execute the query
+            async with asyncio.timeout_at(deadline):
+                try:
+                    # Shielded so a deadline hit here leaves the checkout to finish and be returned to the pool
+                    conn = await asyncio.shield(conn_task)
+                except Exception as e:
+                    logger.warning("Step 5: connection prefetch failed, retrying on execution: %s", e)
+                    conn = None
+                conn_task = None
+                
+                # Independent statements run concurrently on separate pooled connections.
+                # The SQL was cleaned once in Step 4, so the executor runs it as-is
+                statements = split_statements(sql_query)
+                results = await asyncio.gather(
+                    self.query_executor.execute_clean_query(statements[0], conn),
+                    *(self.query_executor.execute_clean_query(statement) for statement in statements[1:])
+                )
+            merged = len(results) > 1
+            query_result = merge_results(results) if merged else results[0]
+            logger.debug("Step 5: %d statement(s) returned %d rows with %d columns",
+                         len(results), row_count(query_result), len(query_result['columns']))
             
+            if meta is None or "sql_query" not in meta:
+                # A near-duplicate hit already has a semantic entry; only the exact entry is new
+                self.meta_cache.add(meta_key, embedding if meta is None else None, (company_code, site_code),
+                                    user_question, routing_result, sql_query)
+            
+            return QueryResult(
+                routing_decision=routing_result,
+                selected_table=selected_table,
+                sql_query=sql_query,
+                data=query_result,
+                sql_token_usage=sql_token_usage,
+                merged=merged or None
+            )
+            
+        except TimeoutError:
+            logger.warning("Orchestrator: request deadline exceeded")
+            return QueryResult(
+                error="Request timed out. Please try again.",
+                code="TIMEOUT",
+                user_question=user_question
+            )
         except Exception as e:
-            print(f"\n❌ MULTI-AGENT ORCHESTRATOR: Error occurred: {str(e)}")
-            return {
-                "error": f"Error processing question: {str(e)}",
-                "user_question": user_question
-            }
+            logger.exception("Orchestrator: error processing question: %s", e)
+            return QueryResult(
+                error=f"Error processing question: {str(e)}",
+                user_question=user_question
+            )
+        finally:
+            if conn_task is not None:
+                _release_when_ready(conn_task)
     
-    async def generate_data_description(self, data: list, sql_query: str, user_question: str) -> str:
+    async def generate_data_description(self, data: dict, sql_query: str, user_question: str, deadline: float = None) -> str:
         """Generate description of the data using o3-mini model with original system message"""
+        # The model would only answer with the fallback message, so skip the round-trip
+        if is_empty_result(data):
+            logger.debug("Description agent: empty result, returning fallback message without calling o3-mini")
+            return NO_DATA_MESSAGE
+        
+        logger.debug("Description agent: describing %d rows for %r (SQL: %s)", row_count(data), user_question, sql_query)
+        
+        # Serialize the result for the description agent, off the event loop
+        data_str = await asyncio.to_thread(_serialize_for_llm, data)
+        
+        message = f"DATA TO ANALYZE:\n{data_str}\n\nSQL QUERY EXECUTED:\n{sql_query}\n\nUSER QUESTION:\n{user_question}"
+        
+        # Only the LLM call can fail at runtime; config problems are caught in __init__
+        try:
+            async with asyncio.timeout_at(_stage_deadline(deadline, DESCRIBE_TIMEOUT_S)):
+                result = await self.description_agent.get_response(messages=message)
+        except TimeoutError:
+            logger.warning("Description agent: timed out waiting for o3-mini, using fallback message")
+            return NO_DATA_MESSAGE
+        except Exception as e:
+            logger.warning("Description agent: error, using fallback message: %s", e)
+            return NO_DATA_MESSAGE
+        
+        if result and result.content and result.content.content:
+            description = result.content.content.strip()
+            logger.debug("Description agent: received %d characters from o3-mini", len(description))
+            return description if description else NO_DATA_MESSAGE
+        
+        logger.warning("Description agent: no valid response from o3-mini, using fallback message")
+        return NO_DATA_MESSAGE
+
+    async def fused_describe(self, user_question: str, sql_query: str, data: dict, deadline: float = None) -> str:
+        """Verify and summarize a small result in a single compact call to the description model"""
+        logger.debug("Fused answer agent: describing %d rows in one pass", row_count(data))
         try:
-            print(f"📝 DESCRIPTION AGENT: Starting to generate description...")
-            print(f"📝 DESCRIPTION AGENT: Data type: {type(data)}")
-            print(f"📝 DESCRIPTION AGENT: Data rows: {len(data) if isinstance(data, list) else 'N/A'}")
-            print(f"📝 DESCRIPTION AGENT: SQL query: {sql_query}")
-            print(f"📝 DESCRIPTION AGENT: User question: {user_question}")
+            async with asyncio.timeout_at(_stage_deadline(deadline, DESCRIBE_TIMEOUT_S)):
+                result = await self.fused_answer_agent.get_response(
+                    messages=f"USER QUESTION:\n{user_question}\n\nSQL QUERY EXECUTED:\n{sql_query}\n\nROWS:\n{_compact_for_llm(data)}"
+                )
+        except TimeoutError:
+            logger.warning("Fused answer agent: timed out, using fallback message")
+            return NO_DATA_MESSAGE
+        except Exception as e:
+            logger.warning("Fused answer agent: error, using fallback message: %s", e)
+            return NO_DATA_MESSAGE
+        
+        if result and result.content and result.content.content:
+            return result.content.content.strip() or NO_DATA_MESSAGE
+        return NO_DATA_MESSAGE
+    
+    async def generate_data_description_batch(self, items: list, deadline: float = None) -> list:
+        """Generate descriptions for several (data, sql_query, user_question) items with one LLM request per batch"""
+        descriptions = []
+        for start in range(0, len(items), DESCRIPTION_BATCH_SIZE):
+            chunk = items[start:start + DESCRIPTION_BATCH_SIZE]
+            descriptions.extend(await self._describe_chunk(chunk, deadline))
+        return descriptions
+    
+    async def _describe_chunk(self, chunk: list, deadline: float = None) -> list:
+        """Describe one batch of items, falling back to per-item calls if the JSON response is unusable"""
+        try:
+            logger.debug("Description agent: describing batch of %d items", len(chunk))
+            batch_input = await asyncio.to_thread(_build_batch_input, chunk)
             
-            # Convert structured data to string format for the description agent
-            if isinstance(data, list) and len(data) > 0:
-                # Convert list of dictionaries to tab-separated string
-                columns = list(data[0].keys())
-                data_str = "\t".join(columns) + "\n"
-                data_str += "\n".join("\t".join(str(row.get(col, "")) for col in columns) for row in data)
-            else:
-                data_str = "No data available"
+            async with asyncio.timeout_at(_stage_deadline(deadline, DESCRIBE_TIMEOUT_S)):
+                result = await self.batch_description_agent.get_response(
+                    messages=f"Describe the following {len(chunk)} items.\n\n{batch_input}"
+                )
+            entries = json.loads(result.content.content)["descriptions"]
+            if len(entries) != len(chunk):
+                raise ValueError(f"expected {len(chunk)} descriptions, got {len(entries)}")
             
-            description_prompt = f"""
-            You are a data analyst assistant for Paperchase, a hospitality and restaurant management company.
+            return [(entry.get("description") or "").strip() or NO_DATA_MESSAGE for entry in entries]
+        except Exception as e:
+            logger.warning("Description agent: batch description failed (%s), falling back to per-item calls", e)
+            return list(await asyncio.gather(*(
+                self.generate_data_description(item["data"], item["sql_query"], item["user_question"], deadline)
+                for item in chunk
+            )))
 
-            Your task is to analyze the provided data and generate a clear markdown formatted, concise description of what the data shows.
+# Cheap input validation, done before any agent or kernel is constructed
+MAX_QUESTION_LENGTH = int(os.getenv("MAX_QUESTION_LENGTH", "1000"))
+COMPANY_CODE_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,20}$")
 
-            IMPORTANT RULES:
-            - If the data is empty, null, or contains no meaningful information, respond ONLY with: "I don't have data for this query. Please try another question."
-            - If the SQL query resulted in an error or no results, respond ONLY with: "I don't have data for this query. Please try another question."
-            - If the data shows "No results found" or similar error messages, respond ONLY with: "I don't have data for this query. Please try another question."
-            - DO NOT generate any analysis, insights, or descriptions if there's no valid data to analyze
-            - Only proceed with analysis if you have actual, meaningful data to work with
+VALIDATION_ERRORS = {
+    "EMPTY_QUESTION": "No question provided",
+    "QUESTION_TOO_LONG": f"Question exceeds the maximum length of {MAX_QUESTION_LENGTH} characters",
+    "INVALID_COMPANY_CODE": "Company code is not valid",
+}
 
-            DATA ANALYSIS GUIDELINES (ONLY if you have valid data):
-            - Focus on key insights and patterns in the data
-            - Highlight important metrics, trends, or anomalies
-            - Use business-friendly language
-            - Keep the description concise, word-to-word, and easy to understand for business users
-            - Mention the number of records analyzed
-            - If there are specific columns with interesting values, mention them
-            - Provide actionable insights when possible
-            - Do not go into too much detail; keep it short and to the point
+def _validate(question: str, company_code: str = None):
+    """Return a validation error code for the request, or None if it can be processed"""
+    if not question or not question.strip():
+        return "EMPTY_QUESTION"
+    if len(question) > MAX_QUESTION_LENGTH:
+        return "QUESTION_TOO_LONG"
+    if company_code and not COMPANY_CODE_PATTERN.match(company_code):
+        return "INVALID_COMPANY_CODE"
+    return None
 
-            DATA TO ANALYZE:
-            {data_str}
+_orchestrator = None
 
-            SQL QUERY EXECUTED:
-            {sql_query}
+# Set by start_server.py --prod: a file of table schemas and samples read once by the parent for every worker
+TABLE_SNAPSHOT_PATH_ENV = "TABLE_SNAPSHOT_PATH"
 
-            USER QUESTION:
-            {user_question}
+def write_table_snapshot(path: str) -> int:
+    """Read every table's schema and sample rows and write them to ``path``; returns the number of tables written"""
+    snapshot = get_table_manager().snapshot()
+    with open(path, "wb") as f:
+        f.write(orjson.dumps(snapshot))
+    return len(snapshot)
 
-            FIRST CHECK: Is the data empty, null, or contains error messages? If yes, respond with "I don't have data for this query. Please try another question."
+def load_table_snapshot(path: str) -> bool:
+    """Seed the shared table manager from a snapshot file; returns False if there is no usable snapshot"""
+    try:
+        with open(path, "rb") as f:
+            snapshot = orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError) as e:
+        logger.warning("Multi-agent system: table snapshot %s not usable, reading schemas from the database: %s", path, e)
+        return False
+    get_table_manager().load_snapshot(snapshot)
+    logger.info("Multi-agent system: loaded %d tables from snapshot %s", len(snapshot), path)
+    return bool(snapshot)
 
-            If you have valid data, generate a clear, business-focused description of what this data reveals. Focus on insights that would be valuable for restaurant management decisions.
-            """
-            
-            print(f"📝 DESCRIPTION AGENT: Created description prompt, sending to o3-mini...")
-            description_agent = ChatCompletionAgent(
-                kernel=self.description_kernel,
-                name="DataDescriptionAgent",
-                instructions=description_prompt,
-                plugins=[]
-            )
-            
-            result = await description_agent.get_response(messages=f"Analyze this data: {data_str}")
-            
-            if result and result.content and result.content.content:
-                description = result.content.content.strip()
-                print(f"📝 DESCRIPTION AGENT: Received response from o3-mini, length: {len(description)} characters")
-                final_description = description if description else "I don't have data for this query. Please try another question."
-                print(f"📝 DESCRIPTION AGENT: Final description: {final_description}")
-                return final_description
-            else:
-                print(f"📝 DESCRIPTION AGENT: No valid response from o3-mini, using fallback message")
-                return "I don't have data for this query. Please try another question."
-                
-        except Exception as e:
-            print(f"📝 DESCRIPTION AGENT: Error occurred: {str(e)}")
-            return "I don't have data for this query. Please try another question."
+async def warm_up():
+    """Create the orchestrator and load all table schemas at startup so no request pays for them"""
+    try:
+        orchestrator = get_orchestrator()
+        snapshot_path = os.getenv(TABLE_SNAPSHOT_PATH_ENV)
+        if snapshot_path and load_table_snapshot(snapshot_path):
+            return
+        await run_db(orchestrator.table_manager.warmup_all)
+    except Exception as e:
+        logger.warning("Multi-agent system: warm-up failed, schemas will load on first use: %s", e)
+
+def get_orchestrator() -> "MultiAgentOrchestrator":
+    """Return the process-wide orchestrator, creating it on first use"""
+    global _orchestrator
+    if _orchestrator is None:
+        _orchestrator = MultiAgentOrchestrator()
+    return _orchestrator
+
+# In-flight requests keyed by normalized (question, company_code, site_code)
+_inflight: dict[str, asyncio.Task] = {}
+
+def _inflight_key(question: str, company_code: str = None, site_code: str = None) -> str:
+    """Return the key under which identical concurrent requests are coalesced"""
+    return f"{normalize_question(question)}|{company_code or ''}|{site_code or ''}"
+
+async def _answer(question: str, company_code: str = None, site_code: str = None) -> dict:
+    """Run a validated question through the orchestrator and return the response dict"""
+    result = await get_orchestrator().process_question(question.strip(), company_code, site_code, _request_deadline())
+    return result.to_dict()
+
+def _finish_inflight(key: str, task: asyncio.Task):
+    """Forget a finished in-flight task and mark its exception as retrieved when no request awaited it"""
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        task.exception()
 
 # Main function to use the orchestrator
 async def run_multi_agent_system(question: str, company_code: str = None, site_code: str = None) -> dict:
     """Main function to run the multi-agent system"""
-    print(f"\n🎬 MULTI-AGENT SYSTEM: Starting multi-agent system...")
-    print(f"🎬 MULTI-AGENT SYSTEM: Question received: '{question}'")
-    print(f"🎬 MULTI-AGENT SYSTEM: Company Code: {company_code}")
-    print(f"🎬 MULTI-AGENT SYSTEM: Site Code: {site_code}")
+    error_code = _validate(question, company_code)
+    if error_code:
+        logger.info("Multi-agent system: rejected request - %s", error_code)
+        return QueryResult(error=VALIDATION_ERRORS[error_code], code=error_code).to_dict()
     
-    if not question or not question.strip():
-        print(f"❌ MULTI-AGENT SYSTEM: Error - No question provided")
-        return {"error": "No question provided"}
+    logger.debug("Multi-agent system: question %r (company=%s, site=%s)", question, company_code, site_code)
+    
+    # Identical questions already being processed share the in-flight result instead of a new pipeline.
+    # The pipeline runs as its own task and every request awaits it shielded, so a cancelled request
+    # (client disconnect or timeout) never cancels the answer its siblings are waiting for
+    key = _inflight_key(question, company_code, site_code)
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_answer(question, company_code, site_code))
+        _inflight[key] = task
+        task.add_done_callback(functools.partial(_finish_inflight, key))
+    else:
+        logger.debug("Multi-agent system: joining in-flight request for the same question")
+    return dict(await asyncio.shield(task))
+
+async def run_multi_agent_system_batch(questions: list) -> list:
+    """Run the multi-agent system for several questions, describing the results in batched LLM requests.
+    
+    Each entry of ``questions`` is a dict with a ``question`` key and optional ``company_code``/``site_code``.
+    """
+    logger.debug("Multi-agent system: starting batch of %d questions", len(questions))
+    results = [None] * len(questions)
+    pending = []
+    for index, item in enumerate(questions):
+        question = item.get("question")
+        error_code = _validate(question, item.get("company_code"))
+        if error_code:
+            results[index] = QueryResult(error=VALIDATION_ERRORS[error_code], code=error_code)
+        else:
+            pending.append((index, question.strip(), item.get("company_code"), item.get("site_code")))
+    
+    if not pending:
+        return [result.to_dict() for result in results]
+    deadline = _request_deadline()
+    orchestrator = get_orchestrator()
+    
+    executed = await asyncio.gather(*(
+        orchestrator.generate_and_execute(question, company_code, site_code, deadline)
+        for _, question, company_code, site_code in pending
+    ))
+    
+    to_describe = []
+    for (index, question, _, _), result in zip(pending, executed):
+        results[index] = result
+        if not result.error:
+            to_describe.append((index, {"data": result.data, "sql_query": result.sql_query, "user_question": question}))
     
-    print(f"🎬 MULTI-AGENT SYSTEM: Creating MultiAgentOrchestrator...")
-    orchestrator = MultiAgentOrchestrator()
-    print(f"🎬 MULTI-AGENT SYSTEM: MultiAgentOrchestrator created successfully")
-    print(f"🎬 MULTI-AGENT SYSTEM: Starting to process question...")
+    descriptions = await orchestrator.generate_data_description_batch([item for _, item in to_describe], deadline)
+    for (index, _), description in zip(to_describe, descriptions):
+        results[index].description = description
     
-    result = await orchestrator.process_question(question.strip(), company_code, site_code)
-    print(f"🎬 MULTI-AGENT SYSTEM: Processing completed. Result keys: {list(result.keys())}")
-    return result 
\ No newline at end of file
+    return [result.to_dict() for result in results]
@@ -1,7 +1,19 @@
 import os
+import re
 import asyncio
+import atexit
+import functools
+import glob
 import json
+import string
+import csv
+import io
+import pathlib
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import sqlglot
+from sqlglot import exp
 from semantic_kernel import Kernel
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 from semantic_kernel.functions.kernel_function_decorator import kernel_function
@@ -9,48 +21,212 @@ from semantic_kernel.agents import ChatCompletionAgent
 # Removed fetch_latest_v2_from_cosmos dependency
 from core.config import AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY, API_VERSION_GA, SERVER, DATABASE, USERNAME, PASSWORD, AZURE_OPENAI_DEPLOYMENT_NAME, AZURE_OPENAI_DEPLOYMENT_NAME_DESCRIPTION
 
+# Patterns used on every generated query, compiled once
+_TABLE_RE = re.compile(r'from\s+(\w+)|join\s+(\w+)', re.IGNORECASE)
+# Markdown fences and the explanatory header lines the model likes to add, stripped in one pass
+_CLEAN = re.compile(r'```sql\s*|```\s*|(?:###|Query \d+:|To compare|I will generate|These queries)[^\n]*\n')
+_SQL_STMT_RE = re.compile(r'SELECT.*?LIMIT\s+\d+', re.IGNORECASE | re.DOTALL)
+
+@functools.lru_cache(maxsize=1024)
+def _analyze_query(sql: str) -> tuple:
+    """Return (lower-cased table names in order of appearance, whether the query joins) for a query.
+    
+    sqlglot parses every statement in one linear pass and ignores CTE names and text inside string
+    literals; queries it cannot parse fall back to the FROM/JOIN regex.
+    """
+    try:
+        trees = [tree for tree in sqlglot.parse(sql, read="sqlite") if tree is not None]
+    except sqlglot.errors.SqlglotError:
+        # Parse and tokenizer errors alike (e.g. an unterminated quote) fall back to the regex
+        tables = tuple(
+            (from_table or join_table).lower()
+            for from_table, join_table in _TABLE_RE.findall(sql)
+        )
+        return tables, 'join' in sql.lower()
+    
+    tables = []
+    has_join = False
+    for tree in trees:
+        cte_names = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+        tables.extend(
+            table.name.lower() for table in tree.find_all(exp.Table)
+            if table.name.lower() not in cte_names
+        )
+        has_join = has_join or next(tree.find_all(exp.Join), None) is not None
+    return tuple(tables), has_join
+
+def _extract_tables(sql: str) -> tuple:
+    """Return the lower-cased table names a query reads from, in order of appearance"""
+    return _analyze_query(sql)[0]
+
+@functools.lru_cache(maxsize=1)
+def _list_db_files(workspace_path, mtime):
+    """Glob the workspace for databases; mtime is only part of the cache key"""
+    return tuple(glob.glob(os.path.join(workspace_path, "*.db")))
+
 # Dynamic database detection - No hardcoded paths needed!
 def get_workspace_databases():
     """Dynamically detect all SQLite databases in the workspace"""
-    import glob
     workspace_path = r"C:\Users\Paperchase.AHM-LT-0006\OneDrive - Paperchase Accountancy\Documents\NLP-to-SQL_multi-agentic"
-    db_files = glob.glob(os.path.join(workspace_path, "*.db"))
-    return db_files
+    # Adding or removing a file bumps the directory mtime, so the glob only reruns when the listing changed
+    try:
+        mtime = os.path.getmtime(workspace_path)
+    except OSError:
+        return []
+    return list(_list_db_files(workspace_path, mtime))
+
+# Applied once to every pooled connection: WAL readers never block, and the larger page cache,
+# in-memory temp storage and memory-mapped I/O keep repeat reads off the disk; with cache_spill off
+# dirty pages stay in that cache instead of being flushed mid-transaction
+_CONNECTION_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-64000;
+PRAGMA mmap_size=30000000000;
+PRAGMA cache_spill=OFF;
+"""
+
+# Read-only connections cannot change the journal mode or sync level, only the read-side caches
+_READ_ONLY_PRAGMAS = """
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-64000;
+PRAGMA mmap_size=30000000000;
+PRAGMA cache_spill=OFF;
+"""
+
+# One long-lived connection per (database, read-only flag), each guarded by its own lock since
+# sqlite3 connections must not be used from two threads at once
+_CONN_POOL: dict[tuple[str, bool], tuple[sqlite3.Connection, threading.Lock]] = {}
+_POOL_LOCK = threading.Lock()
+
+def _open_conn(db_path, read_only):
+    """Open a tuned connection; read-only ones use a mode=ro URI so no journal or WAL file is created"""
+    if read_only:
+        uri = pathlib.Path(os.path.abspath(db_path)).as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        pragmas = _READ_ONLY_PRAGMAS
+    else:
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        pragmas = _CONNECTION_PRAGMAS
+    try:
+        conn.executescript(pragmas)
+    except sqlite3.Error as e:
+        # Read-only or locked files cannot switch journal mode; the connection still works
+        print(f"Could not apply PRAGMAs to {db_path}: {e}")
+    return conn
+
+def _get_conn(db_path, read_only=False):
+    """Return the pooled (connection, lock) pair for a database, opening and tuning it on first use"""
+    key = (db_path, read_only)
+    with _POOL_LOCK:
+        entry = _CONN_POOL.get(key)
+        if entry is None:
+            entry = (_open_conn(db_path, read_only), threading.Lock())
+            _CONN_POOL[key] = entry
+        return entry
+
+def _close_conn(db_path):
+    """Close and forget the pooled connections for a database, if any"""
+    with _POOL_LOCK:
+        entries = [_CONN_POOL.pop((db_path, read_only), None) for read_only in (False, True)]
+    for entry in entries:
+        if entry:
+            with entry[1]:
+                entry[0].close()
+
+@atexit.register
+def _close_pool():
+    """Close every pooled connection at interpreter shutdown"""
+    for db_path in {db_path for db_path, _ in list(_CONN_POOL)}:
+        _close_conn(db_path)
+
+# Constant SQL text, so sqlite3's per-connection statement cache reuses the compiled bytecode
+# instead of preparing a fresh "PRAGMA table_info(<name>)" for every table
+_LIST_TABLES_SQL = "SELECT name FROM sqlite_master WHERE type='table';"
+_DESCRIBE_TABLE_SQL = "SELECT name, type, \"notnull\", dflt_value FROM pragma_table_info(?);"
+
+def _list_tables(conn):
+    """Return the names of the tables in a database"""
+    return [row[0] for row in conn.execute(_LIST_TABLES_SQL)]
+
+def _describe_table(conn, table_name):
+    """Return the columns of a table as name/type/not_null/default dicts"""
+    return [
+        {'name': name, 'type': col_type, 'not_null': not_null, 'default': default}
+        for name, col_type, not_null, default in conn.execute(_DESCRIBE_TABLE_SQL, (table_name,))
+    ]
+
+# Schema per database path: (mtime, data_version, {"tables": [...], "columns": {table: [...]}})
+_SCHEMA_CACHE: dict[str, tuple[float, int, dict]] = {}
+
+def _load_schema(db_path):
+    """Return the tables and columns of a database, re-reading them only when the file changed.
+    
+    PRAGMA data_version moves whenever another connection commits (it is only comparable on the
+    same connection, hence the pool), and the mtime check catches a database file that was replaced,
+    so steady-state lookups are one PRAGMA instead of a full scan.
+    """
+    mtime = os.path.getmtime(db_path)
+    cached = _SCHEMA_CACHE.get(db_path)
+    if cached and cached[0] != mtime:
+        _close_conn(db_path)
+    
+    conn, lock = _get_conn(db_path, read_only=True)
+    with lock:
+        data_version = conn.execute("PRAGMA data_version;").fetchone()[0]
+        if cached and cached[0] == mtime and cached[1] == data_version:
+            return cached[2]
+        
+        tables = _list_tables(conn)
+        columns = {table_name: _describe_table(conn, table_name) for table_name in tables}
+    schema = {"tables": tables, "columns": columns}
+    _SCHEMA_CACHE[db_path] = (mtime, data_version, schema)
+    return schema
+
+# Schema scans fan out across databases on their own threads; async callers use a separate
+# long-lived executor so a scan started from one of its workers can never starve itself
+_SCAN_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="sqlite-scan")
+_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="sqlite")
+
+def _scan_one_db(db_path):
+    """Load one database's schema, returning (path, schema, error) so one bad file cannot fail a scan"""
+    try:
+        return db_path, _load_schema(db_path), None
+    except Exception as e:
+        return db_path, None, e
+
+def _scan_databases(db_files):
+    """Load the schemas of several databases in parallel, in input order"""
+    if len(db_files) <= 1:
+        return [_scan_one_db(db_path) for db_path in db_files]
+    return list(_SCAN_EXECUTOR.map(_scan_one_db, db_files))
+
+async def _run_blocking(fn):
+    """Run blocking SQLite work on the module executor"""
+    return await asyncio.get_running_loop().run_in_executor(_EXECUTOR, fn)
+
+def _schema_lines(columns):
+    """Format a {table: [column, ...]} mapping as 'table - column (type)' lines"""
+    return [
+        f"{table_name} - {col['name']} ({col['type']})"
+        for table_name, table_columns in columns.items()
+        for col in table_columns
+    ]
 
 def get_database_info():
     """Get comprehensive information about all databases"""
-    db_files = get_workspace_databases()
     db_info = {}
     
-    for db_path in db_files:
+    for db_path, schema, error in _scan_databases(get_workspace_databases()):
         db_name = os.path.basename(db_path)
-        try:
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            # Get all tables
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
-            
-            db_info[db_name] = {
-                'path': db_path,
-                'tables': {}
-            }
-            
-            for table in tables:
-                table_name = table[0]
-                cursor.execute(f"PRAGMA table_info({table_name});")
-                columns = cursor.fetchall()
-                
-                db_info[db_name]['tables'][table_name] = [
-                    {'name': col[1], 'type': col[2], 'not_null': col[3], 'default': col[4]}
-                    for col in columns
-                ]
-            
-            cursor.close()
-            conn.close()
-        except Exception as e:
-            print(f"Error reading database {db_name}: {e}")
+        if error is not None:
+            print(f"Error reading database {db_name}: {error}")
+            continue
+        db_info[db_name] = {
+            'path': db_path,
+            'tables': dict(schema["columns"])
+        }
     
     return db_info
 
@@ -60,38 +236,21 @@ def get_database_schema(db_path):
         if not os.path.exists(db_path):
             return []
         
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Get all tables
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        
-        schema_info = []
-        for table in tables:
-            table_name = table[0]
-            cursor.execute(f"PRAGMA table_info({table_name});")
-            columns = cursor.fetchall()
-            
-            for col in columns:
-                schema_info.append(f"{table_name} - {col[1]} ({col[2]})")
-        
-        cursor.close()
-        conn.close()
-        return schema_info
+        return _schema_lines(_load_schema(db_path)["columns"])
     except Exception as e:
         return [f"Error reading schema for {db_path}: {str(e)}"]
 
 def get_all_databases_schema():
     """Get schema information for all available databases"""
     all_schema = []
-    db_files = get_workspace_databases()
     
-    for db_path in db_files:
+    for db_path, schema, error in _scan_databases(get_workspace_databases()):
         db_name = os.path.basename(db_path)
         all_schema.append(f"\n--- Database: {db_name} ---")
-        schema_info = get_database_schema(db_path)
-        all_schema.extend(schema_info)
+        if error is not None:
+            all_schema.append(f"Error reading schema for {db_path}: {str(error)}")
+        else:
+            all_schema.extend(_schema_lines(schema["columns"]))
     
     return "\n".join(all_schema)
 
@@ -101,16 +260,18 @@ class GetSchemaPlugin:
         # No static database paths - fully dynamic
         pass
 
+    @staticmethod
+    def read_schema() -> str:
+        """Blocking schema read behind get_schema"""
+        try:
+            # Use dynamic schema detection
+            return get_all_databases_schema()
+        except Exception as e:
+            return f"Error retrieving schema: {e}"
+
     @kernel_function(name="get_schema", description="Retrieves the schema of tables from SQLite databases.")
     async def get_schema(self, _):
-        def run_schema_query():
-            try:
-                # Use dynamic schema detection
-                return get_all_databases_schema()
-            except Exception as e:
-                return f"Error retrieving schema: {e}"
-
-        return await asyncio.to_thread(run_schema_query)
+        return await _run_blocking(self.read_schema)
 
 class QueryPlugin:
     @kernel_function(name="query_input", description="Receives raw input.")
@@ -132,36 +293,13 @@ class QuerySQLitePlugin:
         
         # Try to find the database by checking which tables exist in each database
         available_dbs = get_workspace_databases()
-        table_to_db_mapping = {}
+        table_to_db_mapping = _table_map()
         
-        # First, build a mapping of which tables exist in which databases
-        for db_path in available_dbs:
-            try:
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-                tables = [table[0].lower() for table in cursor.fetchall()]
-                cursor.close()
-                conn.close()
-                
-                for table in tables:
-                    table_to_db_mapping[table] = db_path
-            except:
-                continue
+        # Tables the query reads from, extracted once for both the JOIN check and the lookup below
+        tables_in_query, has_join = _analyze_query(query_lower)
         
         # Check if this is a JOIN query
-        if any(join_type in query_lower for join_type in ['join', 'left join', 'inner join', 'cross join']):
-            # Extract table names from the query (simplified extraction)
-            import re
-            table_pattern = r'from\s+(\w+)|join\s+(\w+)'
-            matches = re.findall(table_pattern, query_lower)
-            tables_in_query = []
-            for match in matches:
-                if match[0]:  # FROM clause
-                    tables_in_query.append(match[0])
-                if match[1]:  # JOIN clause
-                    tables_in_query.append(match[1])
-            
+        if has_join:
             # Check if tables are in different databases
             databases_needed = set()
             for table in tables_in_query:
@@ -172,9 +310,10 @@ class QuerySQLitePlugin:
                 # Cross-database JOIN detected - return error message
                 return "CROSS_DATABASE_JOIN_ERROR"
         
-        # For single database queries, find the appropriate database
-        for table_name, db_path in table_to_db_mapping.items():
-            if table_name in query_lower:
+        # For single database queries, the first referenced table that is known picks the database
+        for table in tables_in_query:
+            db_path = table_to_db_mapping.get(table)
+            if db_path is not None:
                 return db_path
         
         # Default to first available database if no match found
@@ -186,38 +325,10 @@ class QuerySQLitePlugin:
     def get_tables_by_database(self, sql_query: str) -> dict:
         """Get tables mentioned in query grouped by their databases"""
         query_lower = sql_query.lower()
-        available_dbs = get_workspace_databases()
-        table_to_db_mapping = {}
-        db_to_tables = {}
-        
-        # Build mapping of tables to databases
-        for db_path in available_dbs:
-            try:
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-                tables = [table[0] for table in cursor.fetchall()]
-                cursor.close()
-                conn.close()
-                
-                for table in tables:
-                    table_to_db_mapping[table.lower()] = db_path
-                    if db_path not in db_to_tables:
-                        db_to_tables[db_path] = []
-                    db_to_tables[db_path].append(table)
-            except:
-                continue
+        table_to_db_mapping = _table_map()
         
         # Extract table names from query
-        import re
-        table_pattern = r'from\s+(\w+)|join\s+(\w+)'
-        matches = re.findall(table_pattern, query_lower)
-        tables_in_query = []
-        for match in matches:
-            if match[0]:  # FROM clause
-                tables_in_query.append(match[0])
-            if match[1]:  # JOIN clause
-                tables_in_query.append(match[1])
+        tables_in_query = _extract_tables(query_lower)
         
         # Group tables by database
         result = {}
@@ -253,50 +364,59 @@ class QuerySQLitePlugin:
         
         return separate_queries
 
-    @kernel_function(name="query_sqlite", description="Executes a SQLite query on the available databases.")
-    async def query_sqlite(self, sql_query: str) -> str:
-        def run_query():
-            try:
-                query = self.__clean_sql_query__(sql_query)
-                
-                # Dynamically determine which database to use
+    def run_query(self, sql_query: str, db_path: str = None) -> str:
+        """Blocking execution behind query_sqlite: pick the database, run the query and format the rows.
+        
+        Callers that already resolved the database pass it as db_path to skip a second lookup.
+        """
+        try:
+            query = self.__clean_sql_query__(sql_query)
+            
+            # Dynamically determine which database to use
+            if db_path is None:
                 db_path = self.__determine_database__(query)
-                
-                # Check for cross-database JOIN error
-                if db_path == "CROSS_DATABASE_JOIN_ERROR":
-                    # Instead of returning an error, provide guidance for separate queries
-                    tables_by_db = self.get_tables_by_database(query)
-                    if len(tables_by_db) > 1:
-                        guidance = "Multi-database query detected. Here are the tables by database:\n"
-                        for db_path, tables in tables_by_db.items():
-                            db_name = os.path.basename(db_path)
-                            guidance += f"\nDatabase: {db_name}\nTables: {', '.join(tables)}\n"
-                        guidance += "\nPlease generate separate queries for each database using common fields for comparison."
-                        return guidance
-                    else:
-                        return "Error: Cross-database JOIN detected. SQLite does not support joining tables from different databases. Please query tables from the same database or use separate queries."
-                
-                if not os.path.exists(db_path):
-                    return f"Database file {db_path} not found."
-                
-                conn = sqlite3.connect(db_path)
+            
+            # Check for cross-database JOIN error
+            if db_path == "CROSS_DATABASE_JOIN_ERROR":
+                # Instead of returning an error, provide guidance for separate queries
+                tables_by_db = self.get_tables_by_database(query)
+                if len(tables_by_db) > 1:
+                    guidance = "Multi-database query detected. Here are the tables by database:\n"
+                    for db_path, tables in tables_by_db.items():
+                        db_name = os.path.basename(db_path)
+                        guidance += f"\nDatabase: {db_name}\nTables: {', '.join(tables)}\n"
+                    guidance += "\nPlease generate separate queries for each database using common fields for comparison."
+                    return guidance
+                else:
+                    return "Error: Cross-database JOIN detected. SQLite does not support joining tables from different databases. Please query tables from the same database or use separate queries."
+            
+            if not os.path.exists(db_path):
+                return f"Database file {db_path} not found."
+            
+            conn, lock = _get_conn(db_path)
+            with lock:
                 cur = conn.cursor()
                 cur.execute(query)
-                col_names = [desc[0] for desc in cur.description] if cur.description else []
-                rows = cur.fetchall()
-                cur.close()
-                conn.close()
-                
-                if not rows:
+                first_row = cur.fetchone()
+                if first_row is None:
+                    cur.close()
                     return "No results found."
                 
-                result = "\t".join(col_names) + "\n"
-                result += "\n".join("\t".join(str(val) for val in row) for row in rows)
-                return result
-            except Exception as e:
-                return f"Error executing query: {e}"
+                # Rows stream from the cursor straight into the C csv writer, without an intermediate list
+                buffer = io.StringIO()
+                writer = csv.writer(buffer, dialect="excel-tab", lineterminator="\n")
+                writer.writerow([desc[0] for desc in cur.description])
+                writer.writerow(first_row)
+                writer.writerows(cur)
+                cur.close()
+            
+            return buffer.getvalue().rstrip("\n")
+        except Exception as e:
+            return f"Error executing query: {e}"
 
-        return await asyncio.to_thread(run_query)
+    @kernel_function(name="query_sqlite", description="Executes a SQLite query on the available databases.")
+    async def query_sqlite(self, sql_query: str) -> str:
+        return await _run_blocking(functools.partial(self.run_query, sql_query))
 
 # Initialize kernel and plugins
 kernel = Kernel()
@@ -323,9 +443,46 @@ schema_plugin = GetSchemaPlugin()
 query_plugin = QueryPlugin()
 query_executor = QuerySQLitePlugin()
 
+# Last built prompt template and the schema signature it was built from
+_PROMPT_CACHE = {"sig": None, "text": None}
+
+def _schema_signature(scans):
+    """Return a (path, mtime, data_version) tuple per readable database; it changes whenever any schema may have"""
+    return tuple(sorted(
+        (db_path, *_SCHEMA_CACHE[db_path][:2])
+        for db_path, _, error in scans if error is None
+    ))
+
+# Lower-cased table name -> database path, rebuilt only when the schema signature changes
+_TABLE_TO_DB: dict[str, str] = {}
+_TABLE_MAP_STATE = {"sig": None}
+
+def _table_map():
+    """Return the table -> database lookup for the workspace, rebuilding it only after a database changed"""
+    global _TABLE_TO_DB
+    scans = _scan_databases(get_workspace_databases())
+    signature = _schema_signature(scans)
+    if _TABLE_MAP_STATE["sig"] != signature:
+        # Built aside and swapped in, so concurrent readers never see a half-filled map.
+        # Later databases win on duplicate table names, as the per-call mapping always did.
+        _TABLE_TO_DB = {
+            table.lower(): db_path
+            for db_path, schema, error in scans if error is None
+            for table in schema["tables"]
+        }
+        _TABLE_MAP_STATE["sig"] = signature
+    return _TABLE_TO_DB
+
 def generate_dynamic_prompt_template():
+    """Return the prompt template for the available databases, rebuilding it only when a database changed"""
+    signature = _schema_signature(_scan_databases(get_workspace_databases()))
+    if _PROMPT_CACHE["sig"] != signature:
+        _PROMPT_CACHE["text"] = _build_prompt_template(get_database_info())
+        _PROMPT_CACHE["sig"] = signature
+    return _PROMPT_CACHE["text"]
+
+def _build_prompt_template(db_info):
     """Generate a dynamic prompt template based on available databases"""
-    db_info = get_database_info()
     
     # Build database overview
     db_overview = []
@@ -340,11 +497,13 @@ def generate_dynamic_prompt_template():
             # Add column information
             columns_overview.append(f"\n{table_name} Table:")
             for col in columns:
-                columns_overview.append(f"- {col['name']}: {col['type']}")
+                # One line per column, annotations included
+                parts = [f"- {col['name']}: {col['type']}"]
                 if col['not_null']:
-                    columns_overview.append("  (NOT NULL)")
+                    parts.append(" (NOT NULL)")
                 if col['default']:
-                    columns_overview.append(f"  (Default: {col['default']})")
+                    parts.append(f" (Default: {col['default']})")
+                columns_overview.append("".join(parts))
     
     # SQL QUERY PROMPT TEMPLATE
     return f"""
@@ -444,8 +603,18 @@ def generate_dynamic_prompt_template():
         FINAL INSTRUCTION: Return ONLY SQL queries separated by semicolons. NO explanations, NO markdown, NO comments, NO descriptive text. ONLY SQL statements.
         """
 
-# Use dynamic prompt template
-JSON_PROMPT_TEMPLATE = generate_dynamic_prompt_template()
+def _execute_generated_query(sql: str, user_question: str) -> list:
+    """Run one generated query, splitting it per database when it would join across databases"""
+    # Check if this query would cause cross-database JOIN
+    db_path = query_executor.__determine_database__(sql)
+    
+    if db_path == "CROSS_DATABASE_JOIN_ERROR":
+        # Generate separate queries for each database and execute each of them
+        separate_queries = query_executor.generate_separate_queries_for_databases(sql, user_question)
+        return [(separate_sql, query_executor.run_query(separate_sql)) for separate_sql in separate_queries]
+    
+    # Execute the original query on the database resolved above
+    return [(sql, query_executor.run_query(sql, db_path))]
 
 async def run_agent_and_get_queries_and_results(question: str):
     # Require a question to be provided
@@ -455,11 +624,15 @@ async def run_agent_and_get_queries_and_results(question: str):
     # Use the provided question directly
     input_payload = question.strip()
 
+    # Template and schema text both read the databases; fetch them in a single executor hop
+    prompt_template, schema_details = await _run_blocking(
+        lambda: (generate_dynamic_prompt_template(), schema_plugin.read_schema())
+    )
     agent = ChatCompletionAgent(
         kernel=kernel,
         name="SQLAssistantAgent",
-        instructions=JSON_PROMPT_TEMPLATE.format(
-            schema_details=await schema_plugin.get_schema(None),
+        instructions=prompt_template.format(
+            schema_details=schema_details,
             input_text=input_payload
         ),
         plugins=[schema_plugin, query_plugin],
@@ -470,22 +643,12 @@ async def run_agent_and_get_queries_and_results(question: str):
     
     # Clean up the response to extract only SQL queries
     # Remove any markdown formatting, explanations, or comments
-    import re
-    
-    # Remove markdown code blocks
-    raw_sql = re.sub(r'```sql\s*', '', raw_sql)
-    raw_sql = re.sub(r'```\s*', '', raw_sql)
     
-    # Remove explanatory text and headers
-    raw_sql = re.sub(r'###.*?\n', '', raw_sql)
-    raw_sql = re.sub(r'Query \d+:.*?\n', '', raw_sql)
-    raw_sql = re.sub(r'To compare.*?\n', '', raw_sql)
-    raw_sql = re.sub(r'I will generate.*?\n', '', raw_sql)
-    raw_sql = re.sub(r'These queries.*?\n', '', raw_sql)
+    # Remove markdown code blocks, explanatory text and headers
+    raw_sql = _CLEAN.sub('', raw_sql)
     
     # Extract only SQL statements
-    sql_pattern = r'SELECT.*?LIMIT\s+\d+'
-    sql_matches = re.findall(sql_pattern, raw_sql, re.IGNORECASE | re.DOTALL)
+    sql_matches = _SQL_STMT_RE.findall(raw_sql)
     
     if sql_matches:
         # Use the extracted SQL statements
@@ -499,23 +662,11 @@ async def run_agent_and_get_queries_and_results(question: str):
 
     queries_and_results = []
     
-    # Check if any query would result in cross-database JOIN
+    # Each generated query is resolved and executed (including any per-database split) in one executor hop
     for sql in sql_queries:
-        # Check if this query would cause cross-database JOIN
-        db_path = query_executor.__determine_database__(sql)
-        
-        if db_path == "CROSS_DATABASE_JOIN_ERROR":
-            # Generate separate queries for each database
-            separate_queries = query_executor.generate_separate_queries_for_databases(sql, input_payload)
-            
-            # Execute each separate query
-            for separate_sql in separate_queries:
-                output = await query_executor.query_sqlite(separate_sql)
-                queries_and_results.append((separate_sql, output))
-        else:
-            # Execute the original query
-            output = await query_executor.query_sqlite(sql)
-            queries_and_results.append((sql, output))
+        queries_and_results.extend(
+            await _run_blocking(functools.partial(_execute_generated_query, sql, input_payload))
+        )
     
     return queries_and_results
 
@@ -557,37 +708,59 @@ DESCRIPTION_PROMPT_TEMPLATE = """
     - For multi-database scenarios, provide comparative insights and highlight data relationships
 
     DATA TO ANALYZE:
-    {data_to_analyze}
+    $data_to_analyze
 
     SQL QUERY EXECUTED:
-    {sql_query}
+    $sql_query
 
     USER QUESTION:
-    {user_question}
+    $user_question
 
     FIRST CHECK: Is the data empty, null, or contains error messages? If yes, respond with "I don't have data for this query. Please try another question."
 
     If you have valid data, generate a clear, business-focused description of what this data reveals. Focus on insights that would be valuable for restaurant management decisions. If multiple datasets are present, provide comparative analysis and highlight relationships between different data sources.
     """
 
+# Compiled once; substitution fills the three placeholders without re-parsing format fields in the template
+_DESCRIPTION_TEMPLATE = string.Template(DESCRIPTION_PROMPT_TEMPLATE)
+
+NO_DATA_MESSAGE = "I don't have data for this query. Please try another question."
+_NO_DATA_MARKERS = ('no results found', 'error', 'not found', 'empty')
+
+# Long text cells add prompt tokens without adding insight; each field is cut to this many characters
+DESCRIPTION_MAX_FIELD_CHARS = 200
+
+def _clip(value):
+    """Shorten an over-long string field, leaving every other value untouched"""
+    if isinstance(value, str) and len(value) > DESCRIPTION_MAX_FIELD_CHARS:
+        return value[:DESCRIPTION_MAX_FIELD_CHARS] + "..."
+    return value
+
+def _clip_record(record):
+    """Clip the string fields of one dict or tuple record"""
+    if isinstance(record, dict):
+        return {key: _clip(value) for key, value in record.items()}
+    if isinstance(record, (list, tuple)):
+        return [_clip(value) for value in record]
+    return record
+
+def _is_empty_result(data) -> bool:
+    """Return True when query output is empty or only carries an error message"""
+    if not data:
+        return True
+    if isinstance(data, str):
+        return any(marker in data.lower() for marker in _NO_DATA_MARKERS)
+    return (
+        isinstance(data, list) and len(data) == 1 and isinstance(data[0], str)
+        and any(marker in data[0].lower() for marker in _NO_DATA_MARKERS)
+    )
+
 async def generate_data_description(data: list, sql_query: str, user_question: str) -> str:
     """Generate a description of the data using o3-mini model"""
     try:
-        # Format data for analysis
-        if not data:
-            return "I don't have data for this query. Please try another question."
-        
-        # Check if data contains error messages
-        if isinstance(data, str) and any(error_msg in data.lower() for error_msg in ['no results found', 'error', 'not found', 'empty']):
-            return "I don't have data for this query. Please try another question."
-        
-        # Check if data is a list with error messages
-        if isinstance(data, list) and len(data) == 0:
-            return "I don't have data for this query. Please try another question."
-        
-        # Check if data contains only error information
-        if isinstance(data, list) and len(data) == 1 and isinstance(data[0], str) and any(error_msg in data[0].lower() for error_msg in ['no results found', 'error', 'not found', 'empty']):
-            return "I don't have data for this query. Please try another question."
+        # Answer empty and error results directly, without building an agent or calling the model
+        if _is_empty_result(data):
+            return NO_DATA_MESSAGE
         
         # Ensure data is a list
         if not isinstance(data, list):
@@ -597,9 +770,9 @@ async def generate_data_description(data: list, sql_query: str, user_question: s
         if len(data) > 50:
             data = data[:50]  # Take first 50 records for analysis
         
-        # Convert data to a readable format
+        # Convert data to compact JSON; indentation only costs prompt tokens
         try:
-            data_str = json.dumps(data, indent=2, default=str)
+            data_str = json.dumps([_clip_record(record) for record in data], separators=(',', ':'), default=str)
         except Exception as json_error:
             # Fallback to string representation
             data_str = str(data)
@@ -608,7 +781,7 @@ async def generate_data_description(data: list, sql_query: str, user_question: s
         description_agent = ChatCompletionAgent(
             kernel=kernel_mini,
             name="DataDescriptionAgent",
-            instructions=DESCRIPTION_PROMPT_TEMPLATE.format(
+            instructions=_DESCRIPTION_TEMPLATE.substitute(
                 data_to_analyze=data_str,
                 sql_query=sql_query,
                 user_question=user_question
@@ -625,10 +798,10 @@ async def generate_data_description(data: list, sql_query: str, user_question: s
             if description:
                 return description
             else:
-                return "I don't have data for this query. Please try another question."
+                return NO_DATA_MESSAGE
         else:
-            return "I don't have data for this query. Please try another question."
+            return NO_DATA_MESSAGE
         
     except Exception as e:
         print(f"Error in generate_data_description: {str(e)}")
-        return "I don't have data for this query. Please try another question."
\ No newline at end of file
+        return NO_DATA_MESSAGE
\ No newline at end of file
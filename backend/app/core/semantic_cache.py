@@ -0,0 +1,153 @@
+import logging
+import os
+import tempfile
+import time
+import numpy as np
+import orjson
+
+# Cosine similarity at or above which two questions are treated as the same question
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))
+SEMANTIC_CACHE_TTL_S = float(os.getenv("SEMANTIC_CACHE_TTL_S", "3600"))
+
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    """In-process cache of results for near-duplicate questions, matched by embedding cosine similarity"""
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, max_entries: int = SEMANTIC_CACHE_SIZE,
+                 ttl_s: float = SEMANTIC_CACHE_TTL_S):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        # Row i of the matrix is the unit-length embedding of entries[i]
+        self._matrix = None
+        self._entries = []
+
+    @staticmethod
+    def normalize(embedding) -> np.ndarray:
+        """Return the embedding as a unit-length float32 vector so a dot product is cosine similarity"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding: np.ndarray, key: tuple):
+        """Return the cached value of the most similar fresh entry with the same key, or None"""
+        if self._matrix is None:
+            return None
+
+        now = time.time()
+        scores = self._matrix @ embedding
+        for index, entry in enumerate(self._entries):
+            if entry["key"] != key or now - entry["created"] >= self.ttl_s:
+                scores[index] = -1.0
+
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        entry = self._entries[best]
+        entry["last_used"] = now
+        logger.debug("Semantic cache: hit for %r (similarity %.3f)", entry['question'], scores[best])
+        return entry["value"]
+
+    def add(self, embedding: np.ndarray, key: tuple, question: str, value):
+        """Store a value for a question, evicting expired and then least recently used entries when full"""
+        now = time.time()
+        self._entries.append({"key": key, "question": question, "value": value, "created": now, "last_used": now})
+        rows = [embedding] if self._matrix is None else [self._matrix, embedding[np.newaxis, :]]
+        self._matrix = np.vstack(rows)
+
+        if len(self._entries) > self.max_entries:
+            keep = [index for index, entry in enumerate(self._entries) if now - entry["created"] < self.ttl_s]
+            if len(keep) > self.max_entries:
+                keep.sort(key=lambda index: self._entries[index]["last_used"])
+                keep = sorted(keep[len(keep) - self.max_entries:])
+            self._entries = [self._entries[index] for index in keep]
+            self._matrix = self._matrix[keep] if keep else None
+
+    def clear(self):
+        """Drop every cached entry"""
+        self._matrix = None
+        self._entries = []
+
+class MetaCache:
+    """Routing decisions and generated SQL for past questions, persisted to disk between runs.
+    
+    An exact normalized-question hit returns both the routing decision and the SQL. A near-duplicate found by
+    embedding similarity returns only the routing decision: questions that differ in a literal ("sales in March"
+    vs "sales in May") embed closely but need different SQL. Answers are never cached, so SQL always runs on live data.
+    """
+
+    def __init__(self, path: str, threshold: float, max_entries: int, ttl_s: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        # Exact key -> [created, {"routing_decision", "sql_query"}]; dict order is insertion order, so the first key is the oldest
+        self._exact = {}
+        self.semantic = SemanticCache(threshold=threshold, max_entries=max_entries, ttl_s=ttl_s)
+
+    def lookup(self, exact_key: str, embedding, scope: tuple):
+        """Return {"routing_decision", "sql_query"} for an exact key, {"routing_decision"} for a near duplicate, or None"""
+        entry = self._exact.get(exact_key)
+        if entry is not None and time.time() - entry[0] < self.ttl_s:
+            logger.debug("Meta cache: exact hit")
+            return entry[1]
+        if embedding is None:
+            return None
+        return self.semantic.lookup(embedding, scope)
+
+    def add(self, exact_key: str, embedding, scope: tuple, question: str, routing_decision: dict, sql_query: str):
+        """Store routing and SQL under the exact key and, when an embedding is given, the routing for similarity lookups"""
+        self._exact.pop(exact_key, None)
+        self._exact[exact_key] = [time.time(), {"routing_decision": routing_decision, "sql_query": sql_query}]
+        if len(self._exact) > self.max_entries:
+            del self._exact[next(iter(self._exact))]
+        if embedding is not None:
+            self.semantic.add(embedding, scope, question, {"routing_decision": routing_decision})
+
+    def save(self):
+        """Write the cache as JSON through a temp file and an atomic rename; failures are logged, never raised"""
+        matrix = self.semantic._matrix
+        state = {
+            "exact": self._exact,
+            "entries": self.semantic._entries,
+            "matrix": matrix.tolist() if matrix is not None else None,
+        }
+        directory = os.path.dirname(self.path) or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # Workers share the file; each writes its own temp file and the rename replaces the target whole
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".meta_cache.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(orjson.dumps(state))
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except (OSError, TypeError) as e:
+            logger.warning("Meta cache: could not save to %s: %s", self.path, e)
+
+    def load(self):
+        """Read the cache from its file if one exists, keeping only entries that have not expired"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                state = orjson.loads(f.read())
+            now = time.time()
+            exact = {key: entry for key, entry in state["exact"].items() if now - entry[0] < self.ttl_s}
+            keep = [index for index, entry in enumerate(state["entries"]) if now - entry["created"] < self.ttl_s]
+            entries = [state["entries"][index] for index in keep]
+            # JSON has no tuples; scopes are compared as tuples on lookup
+            for entry in entries:
+                entry["key"] = tuple(entry["key"])
+            matrix = np.asarray(state["matrix"], dtype=np.float32)[keep] if keep else None
+        except (OSError, ValueError, KeyError, TypeError, IndexError) as e:
+            logger.warning("Meta cache: ignoring unreadable cache file %s: %s", self.path, e)
+            return
+        
+        self._exact = exact
+        self.semantic._entries = entries
+        self.semantic._matrix = matrix
+        logger.debug("Meta cache: loaded %d exact and %d semantic entries", len(exact), len(entries))
@@ -1,63 +1,78 @@
 import os
 import asyncio
-import json
-import pyodbc
+import csv
+import functools
+import hashlib
+import io
+import itertools
+import re
+import threading
+import time
+import orjson
 from semantic_kernel import Kernel
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 from semantic_kernel.functions.kernel_function_decorator import kernel_function
 from semantic_kernel.agents import ChatCompletionAgent
-from core.config import AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY, API_VERSION_GA, SERVER, DATABASE, USERNAME, PASSWORD, AZURE_OPENAI_DEPLOYMENT_NAME, AZURE_OPENAI_DEPLOYMENT_NAME_DESCRIPTION
-
-# SQL Server connection configuration
-def get_sql_server_connection_string():
-    """Get SQL Server connection string"""
-    return (
-        f"DRIVER={{ODBC Driver 18 for SQL Server}};"
-        f"SERVER={SERVER};DATABASE={DATABASE};"
-        f"UID={USERNAME};PWD={PASSWORD};TrustServerCertificate=yes;"
-    )
+from cachetools import LRUCache, TTLCache
+from core.config import AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY, API_VERSION_GA, SERVER, DATABASE, AZURE_OPENAI_DEPLOYMENT_NAME, AZURE_OPENAI_DEPLOYMENT_NAME_DESCRIPTION
+from core.db_pool import acquire, run_db
+
+# Tables the SQL agent works with
+SCHEMA_TABLES = ('Vw_SI_SalesDetails', 'Vw_SI_SalesSummary', 'View_DiscountDetails')
+
+_COLUMNS_SQL = f"""
+    SELECT 
+        TABLE_NAME,
+        COLUMN_NAME,
+        DATA_TYPE,
+        IS_NULLABLE,
+        COLUMN_DEFAULT
+    FROM INFORMATION_SCHEMA.COLUMNS 
+    WHERE TABLE_NAME IN ({', '.join('?' * len(SCHEMA_TABLES))})
+    ORDER BY TABLE_NAME, ORDINAL_POSITION
+"""
+
+# Patterns used on every generated response, compiled once
+# Markdown fences and explanatory header lines, stripped in one pass
+_CLEAN = re.compile(r'```sql\s*|```\s*|(?:###|Query \d+:|To compare|I will generate|These queries)[^\n]*\n')
+# A whole SELECT or WITH statement, up to its semicolon or the end of the text; statements start a line or follow a ";"
+_RE_SQL = re.compile(r'(?:^|;)\s*((?:WITH|SELECT)\b[^;]+)', re.IGNORECASE | re.MULTILINE)
+
+# Column metadata per (server, database): (fetched_at, {table: [column, ...]})
+_SCHEMA_CACHE = {}
+_SCHEMA_TTL = 300
 
 def get_database_info():
     """Get comprehensive information about SQL Server database tables"""
+    key = (SERVER, DATABASE)
+    cached = _SCHEMA_CACHE.get(key)
+    if cached and time.time() - cached[0] < _SCHEMA_TTL:
+        return cached[1]
+    
     try:
-        conn_str = get_sql_server_connection_string()
-        conn = pyodbc.connect(conn_str)
-        cursor = conn.cursor()
-        
-        # Get information about the specified tables
-        tables = ['Vw_SI_SalesDetails', 'Vw_SI_SalesSummary', 'View_DiscountDetails']
-        db_info = {}
-        
-        for table_name in tables:
-            try:
-                # Get column information
-                cursor.execute(f"""
-                    SELECT 
-                        COLUMN_NAME,
-                        DATA_TYPE,
-                        IS_NULLABLE,
-                        COLUMN_DEFAULT
-                    FROM INFORMATION_SCHEMA.COLUMNS 
-                    WHERE TABLE_NAME = '{table_name}'
-                    ORDER BY ORDINAL_POSITION
-                """)
-                columns = cursor.fetchall()
-                
-                db_info[table_name] = [
-                    {
-                        'name': col[0], 
-                        'type': col[1], 
-                        'nullable': col[2], 
-                        'default': col[3]
-                    }
-                    for col in columns
-                ]
-            except Exception as e:
-                print(f"Error reading table {table_name}: {e}")
-                db_info[table_name] = []
+        # Pooled connection, validated first since schema reads are rare enough for it to have gone stale
+        with acquire(validate=True) as conn:
+            cursor = conn.cursor()
+            
+            # Columns of every table in one parameterized round trip, grouped per table below
+            cursor.execute(_COLUMNS_SQL, *SCHEMA_TABLES)
+            rows = cursor.fetchall()
+            cursor.close()
         
-        cursor.close()
-        conn.close()
+        # Keep the configured table order; tables without visible columns stay as empty lists
+        db_info = {table_name: [] for table_name in SCHEMA_TABLES}
+        canonical = {table_name.lower(): table_name for table_name in SCHEMA_TABLES}
+        for table_name, columns in itertools.groupby(rows, key=lambda row: row[0]):
+            db_info[canonical.get(table_name.lower(), table_name)] = [
+                {
+                    'name': col[1], 
+                    'type': col[2], 
+                    'nullable': col[3], 
+                    'default': col[4]
+                }
+                for col in columns
+            ]
+        _SCHEMA_CACHE[key] = (time.time(), db_info)
         return db_info
     except Exception as e:
         print(f"Error connecting to SQL Server: {e}")
@@ -65,42 +80,41 @@ def get_database_info():
 
 def get_database_schema():
     """Get schema information for the specified tables"""
-    try:
-        conn_str = get_sql_server_connection_string()
-        conn = pyodbc.connect(conn_str)
-        cursor = conn.cursor()
-        
-        tables = ['Vw_SI_SalesDetails', 'Vw_SI_SalesSummary', 'View_DiscountDetails']
-        schema_info = []
-        
-        for table_name in tables:
-            try:
-                cursor.execute(f"""
-                    SELECT 
-                        COLUMN_NAME,
-                        DATA_TYPE,
-                        IS_NULLABLE
-                    FROM INFORMATION_SCHEMA.COLUMNS 
-                    WHERE TABLE_NAME = '{table_name}'
-                    ORDER BY ORDINAL_POSITION
-                """)
-                columns = cursor.fetchall()
-                
-                for col in columns:
-                    schema_info.append(f"{table_name} - {col[0]} ({col[1]})")
-            except Exception as e:
-                schema_info.append(f"Error reading schema for {table_name}: {str(e)}")
-        
-        cursor.close()
-        conn.close()
-        return schema_info
-    except Exception as e:
-        return [f"Error connecting to SQL Server: {str(e)}"]
+    # Derived from the cached column metadata rather than a second INFORMATION_SCHEMA scan
+    db_info = get_database_info()
+    if not db_info:
+        return ["Error connecting to SQL Server: schema unavailable"]
+    
+    return [
+        f"{table_name} - {col['name']} ({col['type']})"
+        for table_name, columns in db_info.items()
+        for col in columns
+    ]
+
+# Rendered schema text and the time its metadata was fetched, rebuilt when the metadata expires
+_SCHEMA_STR = None
+_SCHEMA_STR_LOCK = threading.Lock()
 
 def get_all_databases_schema():
     """Get schema information for all available tables"""
-    schema_info = get_database_schema()
-    return "\n".join(schema_info)
+    global _SCHEMA_STR
+    with _SCHEMA_STR_LOCK:
+        cached = _SCHEMA_CACHE.get((SERVER, DATABASE))
+        if _SCHEMA_STR and cached and _SCHEMA_STR[0] == cached[0]:
+            return _SCHEMA_STR[1]
+        
+        schema_text = "\n".join(get_database_schema())
+        cached = _SCHEMA_CACHE.get((SERVER, DATABASE))
+        if cached:
+            _SCHEMA_STR = (cached[0], schema_text)
+        return schema_text
+
+def cached_schema_details():
+    """Return the rendered schema text while it is fresh, or None when it must be (re)fetched"""
+    schema_str = _SCHEMA_STR
+    if schema_str and time.time() - schema_str[0] < _SCHEMA_TTL:
+        return schema_str[1]
+    return None
 
 
 class GetSchemaPlugin:
@@ -115,13 +129,54 @@ class GetSchemaPlugin:
             except Exception as e:
                 return f"Error retrieving schema: {e}"
 
-        return await asyncio.to_thread(run_schema_query)
+        return await run_db(run_schema_query)
 
 class QueryPlugin:
     @kernel_function(name="query_input", description="Receives raw input.")
     async def query_input(self, input_text: str) -> str:
         return input_text
 
+# Every known table name in one case-insensitive alternation, so a query is scanned once however many tables exist
+_TABLE_RE = re.compile(
+    r'\b(' + '|'.join(re.escape(table) for table in sorted(SCHEMA_TABLES, key=len, reverse=True)) + r')\b',
+    re.IGNORECASE,
+)
+_CANONICAL_TABLES = {table.lower(): table for table in SCHEMA_TABLES}
+
+# Rows pulled from the driver per fetchmany call
+FETCH_BATCH_SIZE = 10000
+
+# Most rows one generated query may return; injected as TOP when a SELECT has none
+MAX_RESULT_ROWS = 1000
+
+# Leading SELECT [DISTINCT|ALL] that is not already followed by TOP
+_RE_SELECT_HEAD = re.compile(r'^(\s*SELECT\s+(?!\s*(?:(?:DISTINCT|ALL)\s+)?TOP\b)(?:(?:DISTINCT|ALL)\s+)?)', re.IGNORECASE)
+# OFFSET ... FETCH paging, which SQL Server rejects in combination with TOP
+_RE_PAGED = re.compile(r'\b(?:OFFSET|FETCH)\b', re.IGNORECASE)
+
+def _format_result_set(cursor) -> str:
+    """Format the cursor's current result set as tab-separated values, capped at MAX_RESULT_ROWS rows"""
+    # Get column names
+    columns = [column[0] for column in cursor.description] if cursor.description else []
+    
+    # Write rows batch by batch; the C csv writer does the per-cell formatting
+    cursor.arraysize = FETCH_BATCH_SIZE
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, dialect="excel-tab", lineterminator="\n")
+    writer.writerow(columns)
+    row_count = 0
+    while row_count < MAX_RESULT_ROWS:
+        batch = cursor.fetchmany(min(FETCH_BATCH_SIZE, MAX_RESULT_ROWS - row_count))
+        if not batch:
+            break
+        writer.writerows(batch)
+        row_count += len(batch)
+    
+    if not row_count:
+        return "No results found."
+    
+    return buffer.getvalue().rstrip("\n")
+
 class QuerySQLServerPlugin:
     def __init__(self) -> None:
         pass
@@ -132,52 +187,67 @@ class QuerySQLServerPlugin:
 
     def __determine_table__(self, sql_query: str) -> str:
         """Determine which table to use based on the query"""
-        query_lower = sql_query.lower()
-        
-        # Check which table is mentioned in the query
-        tables = ['Vw_SI_salesdetails', 'Vw_SI_salessummary', 'View_DiscountDetails']
-        
-        for table in tables:
-            if table in query_lower:
-                return table
+        # The first known table mentioned in the query, found in a single scan
+        match = _TABLE_RE.search(sql_query)
+        if match:
+            return _CANONICAL_TABLES[match.group(1).lower()]
         
         # Default to SalesSummary if no specific table mentioned
-        return 'Vw_SI_salessummary'
+        return 'Vw_SI_SalesSummary'
+
+    @classmethod
+    def __prepare_query__(cls, sql_query: str) -> str:
+        """Clean a generated query and bound the rows the server sends back even when the model left TOP out"""
+        query = cls.__clean_sql_query__(sql_query)
+        if _RE_PAGED.search(query):
+            # Already bounded by its FETCH clause
+            return query
+        return _RE_SELECT_HEAD.sub(rf'\g<1>TOP {MAX_RESULT_ROWS} ', query, count=1)
 
     @kernel_function(name="query_sqlserver", description="Executes a SQL Server query on the available tables.")
     async def query_sqlserver(self, sql_query: str) -> str:
         def run_query():
             try:
-                query = self.__clean_sql_query__(sql_query)
-                
-                # Connect to SQL Server
-                conn_str = get_sql_server_connection_string()
-                conn = pyodbc.connect(conn_str)
-                cursor = conn.cursor()
-                
-                # Execute the query
-                cursor.execute(query)
-                
-                # Get column names
-                columns = [column[0] for column in cursor.description] if cursor.description else []
-                
-                # Fetch all rows
-                rows = cursor.fetchall()
+                query = self.__prepare_query__(sql_query)
                 
-                cursor.close()
-                conn.close()
+                # Borrow a pooled SQL Server connection instead of reconnecting per query
+                with acquire(validate=True) as conn:
+                    cursor = conn.cursor()
+                    
+                    # Execute the query
+                    cursor.execute(query)
+                    result = _format_result_set(cursor)
+                    
+                    cursor.close()
                 
-                if not rows:
-                    return "No results found."
-                
-                # Format results as tab-separated values
-                result = "\t".join(columns) + "\n"
-                result += "\n".join("\t".join(str(val) for val in row) for row in rows)
                 return result
             except Exception as e:
                 return f"Error executing query: {e}"
 
-        return await asyncio.to_thread(run_query)
+        return await run_db(run_query)
+
+    def run_batch(self, sql_queries: list) -> list:
+        """Blocking execution of several queries as one batch, returning one formatted result per query.
+        
+        Raises when any statement fails or the result sets do not line up with the queries, so the
+        caller can fall back to running them one by one.
+        """
+        queries = [self.__prepare_query__(sql_query).rstrip(";") for sql_query in sql_queries]
+        with acquire(validate=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(";\n".join(queries))
+            results = [_format_result_set(cursor)]
+            while cursor.nextset():
+                results.append(_format_result_set(cursor))
+            cursor.close()
+        
+        if len(results) != len(queries):
+            raise ValueError(f"Batch returned {len(results)} result sets for {len(queries)} queries")
+        return results
+
+    async def query_sqlserver_batch(self, sql_queries: list) -> list:
+        """Run several independent queries over one connection and one round trip"""
+        return await run_db(self.run_batch, sql_queries)
 
 # Initialize kernel and plugins
 kernel = Kernel()
@@ -204,25 +274,56 @@ schema_plugin = GetSchemaPlugin()
 query_plugin = QueryPlugin()
 query_executor = QuerySQLServerPlugin()
 
+# Rendered prompt templates keyed by a digest of the schema they describe
+_PROMPT_TEMPLATES = LRUCache(maxsize=4)
+
 def generate_dynamic_prompt_template():
-    """Generate a dynamic prompt template based on available SQL Server tables"""
-    db_info = get_database_info()
-    
+    """Generate a dynamic prompt template based on available SQL Server tables; blocks on a schema cache miss"""
+    return _prompt_template_for(get_database_info())
+
+def cached_prompt_template():
+    """Return the prompt template while the schema metadata is fresh, or None when it must be (re)fetched"""
+    cached = _SCHEMA_CACHE.get((SERVER, DATABASE))
+    if cached and time.time() - cached[0] < _SCHEMA_TTL:
+        return _prompt_template_for(cached[1])
+    return None
+
+def load_prompt_inputs():
+    """Fetch the schema text and render the prompt template in one blocking call, meant for a worker thread"""
+    try:
+        schema_details = get_all_databases_schema()
+    except Exception as e:
+        schema_details = f"Error retrieving schema: {e}"
+    # The schema read refreshed the metadata cache when it could; render from it instead of connecting again
+    cached = _SCHEMA_CACHE.get((SERVER, DATABASE))
+    return schema_details, _prompt_template_for(cached[1] if cached else {})
+
+def _prompt_template_for(db_info: dict) -> str:
+    """Return the prompt template for column metadata, re-rendered only when the metadata changes"""
+    digest = hashlib.sha256(orjson.dumps(db_info, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    template = _PROMPT_TEMPLATES.get(digest)
+    if template is None:
+        template = _PROMPT_TEMPLATES[digest] = _render_prompt_template(db_info)
+    return template
+
+def _render_prompt_template(db_info: dict) -> str:
+    """Render the SQL prompt template for a table -> columns mapping"""
     # Build table overview
-    table_overview = []
-    columns_overview = []
+    table_overview = "\n".join(
+        f"Table: {table_name} - Contains {len(columns)} column(s)" for table_name, columns in db_info.items()
+    )
     
-    for table_name, columns in db_info.items():
-        table_overview.append(f"Table: {table_name} - Contains {len(columns)} column(s)")
-        
-        # Add column information
-        columns_overview.append(f"\n{table_name} Table:")
-        for col in columns:
-            columns_overview.append(f"- {col['name']}: {col['type']}")
-            if col['nullable'] == 'NO':
-                columns_overview.append("  (NOT NULL)")
-            if col['default']:
-                columns_overview.append(f"  (Default: {col['default']})")
+    # Add column information, one block per table
+    not_null = "NO"
+    columns_overview = "\n".join(
+        f"\n{table_name} Table:" + "".join(
+            f"\n- {col['name']}: {col['type']}"
+            + ("\n  (NOT NULL)" if col['nullable'] == not_null else "")
+            + (f"\n  (Default: {col['default']})" if col['default'] else "")
+            for col in columns
+        )
+        for table_name, columns in db_info.items()
+    )
     
     # SQL QUERY PROMPT TEMPLATE
     return f"""
@@ -234,11 +335,11 @@ def generate_dynamic_prompt_template():
 
         You have access to the following SQL Server tables in the DataWarehouseV2_UK database:
 
-        {chr(10).join(table_overview)}
+        {table_overview}
 
         COLUMNS OVERVIEW (based on the actual database schema):
 
-        {chr(10).join(columns_overview)}
+        {columns_overview}
 
         SQL GENERATION RULES:
         - ALWAYS limit results to the latest 20 records using TOP 20 at the end of every query
@@ -306,47 +407,75 @@ def generate_dynamic_prompt_template():
         FINAL INSTRUCTION: Return ONLY SQL queries separated by semicolons. NO explanations, NO markdown, NO comments, NO descriptive text. ONLY SQL statements.
         """
 
-# Use dynamic prompt template
-JSON_PROMPT_TEMPLATE = generate_dynamic_prompt_template()
-
-async def run_agent_and_get_queries_and_results(question: str):
-    # Require a question to be provided
-    if not question or not question.strip():
-        return []
-    
-    # Use the provided question directly
-    input_payload = question.strip()
+# Generated SQL per (schema hash, normalized question)
+_SQL_CACHE = TTLCache(maxsize=1024, ttl=600)
 
-    agent = ChatCompletionAgent(
+@functools.lru_cache(maxsize=2)
+def _sql_agent(prompt_template: str, schema_details: str) -> ChatCompletionAgent:
+    """One reusable full SQL agent per (template, schema text); the question is sent as the message, not baked into the instructions"""
+    instructions = (
+        prompt_template
+        .replace("{input_text}", "Provided in the user message.")
+        .replace("{schema_details}", schema_details)
+    )
+    return ChatCompletionAgent(
         kernel=kernel,
         name="SQLAssistantAgent",
-        instructions=JSON_PROMPT_TEMPLATE.format(
-            schema_details=await schema_plugin.get_schema(None),
-            input_text=input_payload
-        ),
+        instructions=instructions,
         plugins=[schema_plugin, query_plugin],
     )
 
+# Short prompt for single-table filter and lookup questions; the question itself arrives as the message
+LIGHT_PROMPT_TEMPLATE = """
+    You are a SQL Server (T-SQL) assistant for Paperchase, a hospitality and restaurant management company.
+
+    Write ONE query that answers the user's question using only these tables and columns:
+
+    {schema_details}
+
+    RULES:
+    - Always use SELECT TOP 20 and the dbo schema prefix (dbo.Vw_SI_SalesDetails, dbo.Vw_SI_SalesSummary, dbo.View_DiscountDetails)
+    - Use SQL Server syntax: TOP instead of LIMIT, GETDATE/DATEADD/DATEDIFF for dates, YYYY-MM-DD date literals
+    - Use LIKE for partial text matches; for summaries use SUM/COUNT/AVG with GROUP BY and apply TOP 20 with ORDER BY
+    - Return ONLY the SQL statement ending with a semicolon: NO explanations, markdown, comments or labels
+    """
+
+# Questions that compare, combine or relate data need the full prompt with its multi-query guidance
+_COMPARE_SHAPE_RE = re.compile(
+    r'\b(?:compar\w*|versus|vs|join\w*|combin\w*|both|across|relat\w*|correlat\w*|difference|each table)\b',
+    re.IGNORECASE,
+)
+
+def is_simple_question(question: str) -> bool:
+    """Return True for plain filter or lookup questions that the light prompt can answer"""
+    return _COMPARE_SHAPE_RE.search(question) is None
+
+@functools.lru_cache(maxsize=2)
+def _light_agent(schema_details: str) -> ChatCompletionAgent:
+    """One reusable light SQL agent per schema text; its instructions do not depend on the question"""
+    return ChatCompletionAgent(
+        kernel=kernel,
+        name="SQLAssistantAgentLight",
+        instructions=LIGHT_PROMPT_TEMPLATE.replace("{schema_details}", schema_details),
+    )
+
+async def _generate_sql_queries(input_payload: str, schema_details: str, prompt_template: str) -> list:
+    """Ask the SQL agent for queries answering a question and extract the SQL statements from its reply"""
+    if is_simple_question(input_payload):
+        agent = _light_agent(schema_details)
+    else:
+        agent = _sql_agent(prompt_template, schema_details)
+
     result = await agent.get_response(messages=input_payload)
     raw_sql = result.content.content.strip()
     
     # Clean up the response to extract only SQL queries
-    import re
-    
-    # Remove markdown code blocks
-    raw_sql = re.sub(r'```sql\s*', '', raw_sql)
-    raw_sql = re.sub(r'```\s*', '', raw_sql)
     
-    # Remove explanatory text and headers
-    raw_sql = re.sub(r'###.*?\n', '', raw_sql)
-    raw_sql = re.sub(r'Query \d+:.*?\n', '', raw_sql)
-    raw_sql = re.sub(r'To compare.*?\n', '', raw_sql)
-    raw_sql = re.sub(r'I will generate.*?\n', '', raw_sql)
-    raw_sql = re.sub(r'These queries.*?\n', '', raw_sql)
+    # Remove markdown code blocks, explanatory text and headers
+    raw_sql = _CLEAN.sub('', raw_sql)
     
     # Extract only SQL statements
-    sql_pattern = r'SELECT.*?TOP\s+\d+'
-    sql_matches = re.findall(sql_pattern, raw_sql, re.IGNORECASE | re.DOTALL)
+    sql_matches = _RE_SQL.findall(raw_sql)
     
     if sql_matches:
         # Use the extracted SQL statements
@@ -358,17 +487,46 @@ async def run_agent_and_get_queries_and_results(question: str):
             if q.strip() and not q.strip().lower().startswith("--") and "SELECT" in q.upper()
         ]
 
-    queries_and_results = []
+    return sql_queries
+
+async def run_agent_and_get_queries_and_results(question: str):
+    # Require a question to be provided
+    if not question or not question.strip():
+        return []
+    
+    # Use the provided question directly
+    input_payload = question.strip()
+    # Warm requests reuse the rendered schema and prompt directly; an expired or missing one costs a single
+    # thread hop for both, so the blocking schema read never runs on the event loop
+    schema_details = cached_schema_details()
+    prompt_template = cached_prompt_template()
+    if schema_details is None or prompt_template is None:
+        schema_details, prompt_template = await run_db(load_prompt_inputs)
     
-    # Execute each query
-    for sql in sql_queries:
-        output = await query_executor.query_sqlserver(sql)
-        queries_and_results.append((sql, output))
+    # A repeated question against an unchanged schema reuses the SQL generated last time
+    cache_key = (hash(schema_details), input_payload.lower())
+    sql_queries = _SQL_CACHE.get(cache_key)
+    if sql_queries is None:
+        sql_queries = await _generate_sql_queries(input_payload, schema_details, prompt_template)
+        if sql_queries:
+            _SQL_CACHE[cache_key] = sql_queries
+
+    # Several independent queries go to the server as one batch; if any statement fails, run them
+    # concurrently on separate pooled connections instead so each gets its own result or error
+    outputs = None
+    if len(sql_queries) > 1:
+        try:
+            outputs = await query_executor.query_sqlserver_batch(sql_queries)
+        except Exception as e:
+            print(f"Batch execution failed, running queries individually: {e}")
+    if outputs is None:
+        outputs = await asyncio.gather(*(query_executor.query_sqlserver(sql) for sql in sql_queries))
+    queries_and_results = list(zip(sql_queries, outputs))
     
     return queries_and_results
 
-# Description generation prompt template
-DESCRIPTION_PROMPT_TEMPLATE = """
+# Description generation instructions; per-request data goes in the message so one agent serves every call
+DESCRIPTION_INSTRUCTIONS = """
     You are a data analyst assistant for Paperchase, a hospitality and restaurant management company.
 
     Your task is to analyze the provided data and generate a clear markdown formatted, concise description of what the data shows.
@@ -390,38 +548,44 @@ DESCRIPTION_PROMPT_TEMPLATE = """
     - Provide actionable insights when possible
     - Do not go into too much detail; keep it short and to the point
 
-    DATA TO ANALYZE:
-    {data_to_analyze}
-
-    SQL QUERY EXECUTED:
-    {sql_query}
-
-    USER QUESTION:
-    {user_question}
+    The data to analyze, the SQL query that produced it and the user's question are provided in the user message.
 
     FIRST CHECK: Is the data empty, null, or contains error messages? If yes, respond with "I don't have data for this query. Please try another question."
 
     If you have valid data, generate a clear, business-focused description of what this data reveals. Focus on insights that would be valuable for restaurant management decisions.
     """
 
+description_agent = ChatCompletionAgent(
+    kernel=kernel_mini,
+    name="DataDescriptionAgent",
+    instructions=DESCRIPTION_INSTRUCTIONS,
+    plugins=[query_plugin],
+)
+
+NO_DATA_MESSAGE = "I don't have data for this query. Please try another question."
+
+# Leading text of the strings query_sqlserver and get_schema return instead of rows
+_NO_DATA_PREFIXES = ("No results found", "Error executing query", "Error retrieving schema")
+
+def _is_empty_result(data) -> bool:
+    """Return True when query output is empty or is a single executor sentinel string"""
+    if not data:
+        return True
+    data_type = type(data)
+    if data_type is str:
+        return data.startswith(_NO_DATA_PREFIXES)
+    if data_type is list and len(data) == 1:
+        first = data[0]
+        return type(first) is str and first.startswith(_NO_DATA_PREFIXES)
+    return False
+
 async def generate_data_description(data: list, sql_query: str, user_question: str) -> str:
     """Generate a description of the data using o3-mini model"""
     try:
-        # Format data for analysis
-        if not data:
-            return "I don't have data for this query. Please try another question."
-        
-        # Check if data contains error messages
-        if isinstance(data, str) and any(error_msg in data.lower() for error_msg in ['no results found', 'error', 'not found', 'empty']):
-            return "I don't have data for this query. Please try another question."
-        
-        # Check if data is a list with error messages
-        if isinstance(data, list) and len(data) == 0:
-            return "I don't have data for this query. Please try another question."
-        
-        # Check if data contains only error information
-        if isinstance(data, list) and len(data) == 1 and isinstance(data[0], str) and any(error_msg in data[0].lower() for error_msg in ['no results found', 'error', 'not found', 'empty']):
-            return "I don't have data for this query. Please try another question."
+        # Empty results and executor sentinels are recognised from their shape and prefix alone,
+        # so row values that merely contain a word like "error" are still described
+        if _is_empty_result(data):
+            return NO_DATA_MESSAGE
         
         # Ensure data is a list
         if not isinstance(data, list):
@@ -431,27 +595,17 @@ async def generate_data_description(data: list, sql_query: str, user_question: s
         if len(data) > 50:
             data = data[:50]  # Take first 50 records for analysis
         
-        # Convert data to a readable format
+        # Convert data to compact JSON; indentation only costs encoder time and prompt tokens
         try:
-            data_str = json.dumps(data, indent=2, default=str)
+            data_str = orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
         except Exception as json_error:
             # Fallback to string representation
             data_str = str(data)
         
-        # Create the description agent
-        description_agent = ChatCompletionAgent(
-            kernel=kernel_mini,
-            name="DataDescriptionAgent",
-            instructions=DESCRIPTION_PROMPT_TEMPLATE.format(
-                data_to_analyze=data_str,
-                sql_query=sql_query,
-                user_question=user_question
-            ),
-            plugins=[query_plugin],
-        )
-        
         # Generate description
-        result = await description_agent.get_response(messages=f"Analyze this data: {data_str}")
+        result = await description_agent.get_response(
+            messages=f"DATA TO ANALYZE:\n{data_str}\n\nSQL QUERY EXECUTED:\n{sql_query}\n\nUSER QUESTION:\n{user_question}"
+        )
         
         # Ensure we get a valid response
         if result and result.content and result.content.content:
@@ -459,10 +613,10 @@ async def generate_data_description(data: list, sql_query: str, user_question: s
             if description:
                 return description
             else:
-                return "I don't have data for this query. Please try another question."
+                return NO_DATA_MESSAGE
         else:
-            return "I don't have data for this query. Please try another question."
+            return NO_DATA_MESSAGE
         
     except Exception as e:
         print(f"Error in generate_data_description: {str(e)}")
-        return "I don't have data for this query. Please try another question." 
\ No newline at end of file
+        return NO_DATA_MESSAGE 
\ No newline at end of file
@@ -1,10 +1,14 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from api.agent import router as agent_router
 from api.sqlserver import router as sqlserver_router
 from api.multi_agent import router as multi_agent_router
+from core.multi_agent_orchestrator import warm_up
+from core.db_pool import prewarm as prewarm_db_pool, shutdown as shutdown_db_pool
 
-app = FastAPI()
+# orjson serializes large row sets several times faster than the stdlib json encoder
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -15,6 +19,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def warm_up_db_pool():
+    """Open pooled SQL Server connections before the first request arrives"""
+    await prewarm_db_pool()
+
+@app.on_event("startup")
+async def warm_up_multi_agent():
+    """Load table schemas before the first request arrives"""
+    await warm_up()
+
+@app.on_event("shutdown")
+async def close_db_pool():
+    """Stop the database executor and close pooled SQL Server connections"""
+    shutdown_db_pool()
+
 @app.get("/")
 def read_root():
     return {"status": "ok", "message": "Paperchase ERP Backend is running"}
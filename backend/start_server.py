@@ -3,6 +3,9 @@
 Startup script for the SQL Server backend
 """
 
+import argparse
+import importlib.util
+import tempfile
 import uvicorn
 import sys
 import os
@@ -10,12 +13,56 @@ import os
 # Add the app directory to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Start the Paperchase ERP backend")
+    parser.add_argument(
+        "--prod",
+        action="store_true",
+        help="performance mode: no reload, one worker per CPU, uvloop/httptools, warning-level logs"
+    )
+    return parser.parse_args()
+
+def write_table_snapshot():
+    """Read table schemas and samples once in this process and point every worker at the result.
+    
+    Returns the snapshot path, which the caller removes once the server has stopped, or None.
+    """
+    path = os.path.join(tempfile.gettempdir(), f"paperchase_tables_{os.getpid()}.json")
+    try:
+        from core.multi_agent_orchestrator import TABLE_SNAPSHOT_PATH_ENV, write_table_snapshot as write_snapshot
+        count = write_snapshot(path)
+    except Exception as e:
+        print(f"Could not prebuild table snapshot, each worker will read schemas itself: {e}")
+        remove_file(path)
+        return None
+    # Workers are spawned after this point and inherit the environment
+    os.environ[TABLE_SNAPSHOT_PATH_ENV] = path
+    print(f"Table snapshot: {count} tables written to {path}")
+    return path
+
+def remove_file(path):
+    """Delete a file if it exists"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def has_module(name):
+    """Check whether an optional server extra (uvloop, httptools) is installed"""
+    return importlib.util.find_spec(name) is not None
+
 if __name__ == "__main__":
+    args = parse_args()
+    
     print("Starting Paperchase ERP Backend with SQL Server...")
     print("Server: 10.0.40.20")
     print("Database: DataWarehouseV2_UK")
     print("Available Tables: Vw_SI_SalesDetails, Vw_SI_SalesSummary, View_DiscountDetails")
     print("\nStarting server on http://localhost:8000")
+    snapshot_path = None
+    if args.prod:
+        print(f"Production mode: {os.cpu_count()} workers, reload disabled")
+        snapshot_path = write_table_snapshot()
     print("Press Ctrl+C to stop the server")
     
     try:
@@ -23,11 +70,19 @@ if __name__ == "__main__":
             "app.main:app",
             host="0.0.0.0",
             port=8000,
-            reload=True,
-            log_level="info"
+            reload=not args.prod,
+            log_level="warning" if args.prod else "info",
+            workers=os.cpu_count() if args.prod else 1,
+            # uvicorn[standard] installs uvloop and httptools; uvloop is unavailable on Windows, so fall back to auto
+            loop="uvloop" if args.prod and has_module("uvloop") else "auto",
+            http="httptools" if has_module("httptools") else "auto"
         )
     except KeyboardInterrupt:
         print("\nServer stopped by user")
     except Exception as e:
         print(f"Error starting server: {e}")
-        print("Please check your configuration and try again") 
\ No newline at end of file
+        print("Please check your configuration and try again")
+    finally:
+        # Workers (including any the supervisor restarts) read the snapshot only while the server runs
+        if snapshot_path:
+            remove_file(snapshot_path)
@@ -7,6 +7,9 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
 
 from core.multi_agent_orchestrator import run_multi_agent_system
 
+# Questions run concurrently, bounded so a test run stays under the LLM rate limits
+MAX_CONCURRENT_QUESTIONS = 8
+
 async def test_agent_flow():
     """Test the multi-agent flow with detailed logging"""
     
@@ -20,13 +23,23 @@ async def test_agent_flow():
         "Give me company information"
     ]
     
-    for i, question in enumerate(test_questions, 1):
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUESTIONS)
+    
+    async def run_one(question):
+        async with semaphore:
+            return await run_multi_agent_system(question)
+    
+    # The questions are independent, so their LLM and SQL round trips overlap; results print in order
+    results = await asyncio.gather(*(run_one(question) for question in test_questions), return_exceptions=True)
+    
+    for i, (question, result) in enumerate(zip(test_questions, results), 1):
         print(f"\n{'='*60}")
         print(f"🧪 TEST {i}: {question}")
         print(f"{'='*60}")
         
         try:
-            result = await run_multi_agent_system(question)
+            if isinstance(result, Exception):
+                raise result
             
             print(f"\n📊 TEST {i} RESULTS:")
             print(f"Selected Table: {result.get('selected_table', 'N/A')}")
@@ -7,6 +7,9 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
 
 from core.multi_agent_orchestrator import run_multi_agent_system
 
+# Questions run concurrently, bounded so a test run stays under the LLM rate limits
+MAX_CONCURRENT_QUESTIONS = 8
+
 async def test_company_integration():
     """Test the company integration with multi-agent system"""
     
@@ -32,7 +35,20 @@ async def test_company_integration():
         }
     ]
     
-    for i, test_case in enumerate(test_cases, 1):
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUESTIONS)
+    
+    async def run_one(test_case):
+        async with semaphore:
+            return await run_multi_agent_system(
+                test_case['question'], 
+                test_case['company_code'],
+                test_case['country']
+            )
+    
+    # The cases are independent, so their LLM and SQL round trips overlap; results print in order
+    results = await asyncio.gather(*(run_one(test_case) for test_case in test_cases), return_exceptions=True)
+    
+    for i, (test_case, result) in enumerate(zip(test_cases, results), 1):
         print(f"\n{'='*60}")
         print(f"🧪 TEST {i}: {test_case['question']}")
         print(f"🧪 COMPANY CODE: {test_case['company_code']}")
@@ -40,11 +56,8 @@ async def test_company_integration():
         print(f"{'='*60}")
         
         try:
-            result = await run_multi_agent_system(
-                test_case['question'], 
-                test_case['company_code'],
-                test_case['country']
-            )
+            if isinstance(result, Exception):
+                raise result
             
             print(f"\n📊 TEST {i} RESULTS:")
             print(f"Selected Table: {result.get('selected_table', 'N/A')}")
@@ -1,13 +1,27 @@
 import asyncio
 import sys
 import os
-import requests
-import json
+import httpx
+import orjson
 
 # Add the app directory to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
 
-def test_multi_agent_endpoint():
+MULTI_AGENT_URL = 'http://localhost:8000/api/multi-agent'
+MULTI_AGENT_BATCH_URL = 'http://localhost:8000/api/multi-agent/batch'
+
+# Rows returned per result; the tests read row_count for the unsampled count
+SAMPLE_ROWS = 3
+
+# Shared client settings: JSON headers sent on every request, and a small keep-alive pool reused across requests
+CLIENT_HEADERS = {'Content-Type': 'application/json'}
+CLIENT_LIMITS = httpx.Limits(max_keepalive_connections=4, max_connections=16)
+
+async def post_question(client, question):
+    """POST one question to the multi-agent endpoint"""
+    return await client.post(MULTI_AGENT_URL, params={'sample': SAMPLE_ROWS}, content=orjson.dumps({'question': question}))
+
+async def test_multi_agent_endpoint(client):
     """Test the multi-agent endpoint to ensure it works with frontend"""
     
     # Test questions that should route to different tables
@@ -20,26 +34,36 @@ def test_multi_agent_endpoint():
     print("🧪 Testing Multi-Agent Frontend Integration")
     print("=" * 60)
     
-    for i, question in enumerate(test_questions, 1):
+    # One request carries every question; the backend runs them concurrently and answers in order
+    try:
+        # Only counts and a small sample are checked, so the full result sets are not transferred
+        batch_response = await client.post(
+            MULTI_AGENT_BATCH_URL, params={'sample': SAMPLE_ROWS}, content=orjson.dumps({'questions': test_questions})
+        )
+    except Exception as e:
+        print(f"❌ Exception: {str(e)}")
+        return
+    
+    if batch_response.status_code != 200:
+        print(f"❌ Error: {batch_response.status_code}")
+        print(f"Response: {batch_response.text}")
+        return
+    
+    responses = orjson.loads(batch_response.content)['responses']
+    
+    for i, (question, response) in enumerate(zip(test_questions, responses), 1):
         print(f"\n📝 Test {i}: {question}")
         print("-" * 40)
         
         try:
-            # Make request to the multi-agent endpoint
-            response = requests.post(
-                'http://localhost:8000/api/multi-agent',
-                json={'question': question},
-                headers={'Content-Type': 'application/json'}
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
+            if response['status'] == 200:
+                data = response['data']
                 
-                print(f"✅ Status: {response.status_code}")
+                print(f"✅ Status: {response['status']}")
                 print(f"📊 Selected Table: {data.get('selected_table', 'N/A')}")
                 print(f"🎯 Confidence: {data.get('routing_decision', {}).get('confidence', 'N/A')}")
                 print(f"🔍 SQL Query: {data.get('sql_query', 'N/A')}")
-                print(f"📈 Data Records: {len(data.get('data', []))}")
+                print(f"📈 Data Records: {data.get('row_count', 'N/A')}")
                 print(f"📝 Answer: {data.get('answer', 'N/A')[:100]}...")
                 
                 # Check if response structure matches frontend expectations
@@ -52,29 +76,25 @@ def test_multi_agent_endpoint():
                     print("✅ Response structure matches frontend expectations")
                     
             else:
-                print(f"❌ Error: {response.status_code}")
-                print(f"Response: {response.text}")
+                print(f"❌ Error: {response['status']}")
+                print(f"Response: {response['data']}")
                 
         except Exception as e:
             print(f"❌ Exception: {str(e)}")
         
         print("-" * 40)
 
-def test_frontend_compatibility():
+async def test_frontend_compatibility(client):
     """Test if the response structure is compatible with frontend"""
     
     print("\n🔍 Testing Frontend Compatibility")
     print("=" * 40)
     
     try:
-        response = requests.post(
-            'http://localhost:8000/api/multi-agent',
-            json={'question': 'Show me total sales by month'},
-            headers={'Content-Type': 'application/json'}
-        )
+        response = await post_question(client, 'Show me total sales by month')
         
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             
             # Check frontend interface compatibility
             frontend_interface = {
@@ -98,7 +118,7 @@ def test_frontend_compatibility():
                     print(f"  ❌ {field}: Missing")
             
             print(f"\n📊 Sample Response Structure:")
-            print(json.dumps(data, indent=2)[:500] + "...")
+            print(orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()[:500] + "...")
             
         else:
             print(f"❌ Server error: {response.status_code}")
@@ -106,13 +126,18 @@ def test_frontend_compatibility():
     except Exception as e:
         print(f"❌ Test failed: {str(e)}")
 
+async def run_tests():
+    """Run both tests over one client so they share keep-alive connections to the backend"""
+    async with httpx.AsyncClient(timeout=httpx.Timeout(120.0), headers=CLIENT_HEADERS, limits=CLIENT_LIMITS) as client:
+        await test_multi_agent_endpoint(client)
+        await test_frontend_compatibility(client)
+
 if __name__ == "__main__":
     print("🚀 Starting Frontend Integration Tests")
     print("Make sure your backend server is running on http://localhost:8000")
     print()
     
-    test_multi_agent_endpoint()
-    test_frontend_compatibility()
+    asyncio.run(run_tests())
     
     print("\n🎉 Frontend Integration Tests Complete!")
     print("\nTo test with your frontend:")
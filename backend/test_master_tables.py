@@ -7,6 +7,9 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
 
 from core.multi_agent_orchestrator import run_multi_agent_system
 
+# Questions run concurrently, bounded so a test run stays under the LLM rate limits
+MAX_CONCURRENT_QUESTIONS = 8
+
 async def test_master_tables():
     """Test the master tables and INNER JOIN functionality"""
     
@@ -65,7 +68,20 @@ async def test_master_tables():
         }
     ]
     
-    for i, test_case in enumerate(test_cases, 1):
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUESTIONS)
+    
+    async def run_one(test_case):
+        async with semaphore:
+            return await run_multi_agent_system(
+                test_case['question'],
+                test_case['company_code'],
+                test_case['site_code']
+            )
+    
+    # The cases are independent, so their LLM and SQL round trips overlap; results print in order
+    results = await asyncio.gather(*(run_one(test_case) for test_case in test_cases), return_exceptions=True)
+    
+    for i, (test_case, result) in enumerate(zip(test_cases, results), 1):
         print(f"\n🧪 Test {i}: {test_case['name']}")
         print("-" * 40)
         print(f"Question: {test_case['question']}")
@@ -73,11 +89,8 @@ async def test_master_tables():
         print(f"Site Code: {test_case['site_code']}")
         
         try:
-            result = await run_multi_agent_system(
-                test_case['question'],
-                test_case['company_code'],
-                test_case['site_code']
-            )
+            if isinstance(result, Exception):
+                raise result
             
             if "error" in result:
                 print(f"❌ Error: {result['error']}")
@@ -85,7 +98,7 @@ async def test_master_tables():
                 print(f"✅ Success!")
                 print(f"Selected Table: {result.get('selected_table', 'N/A')}")
                 print(f"SQL Query: {result.get('sql_query', 'N/A')}")
-                print(f"Data Rows: {len(result.get('data', []))}")
+                print(f"Data Rows: {result.get('row_count', 0)}")
                 print(f"Description: {result.get('description', 'N/A')[:100]}...")
                 
                 # Show first few rows of data
@@ -5,7 +5,7 @@ import os
 # Add the app directory to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
 
-from core.multi_agent_orchestrator import run_multi_agent_system
+from core.multi_agent_orchestrator import run_multi_agent_system_batch
 
 async def test_multi_agent_system():
     """Test the multi-agent system with different types of questions"""
@@ -22,13 +22,18 @@ async def test_multi_agent_system():
     print("🧪 Testing Multi-Agent Orchestration System")
     print("=" * 60)
     
-    for i, question in enumerate(test_questions, 1):
+    # One batch call runs every question concurrently and describes the results in batched LLM requests
+    try:
+        results = await run_multi_agent_system_batch([{"question": question} for question in test_questions])
+    except Exception as e:
+        print(f"❌ Exception: {str(e)}")
+        return
+    
+    for i, (question, result) in enumerate(zip(test_questions, results), 1):
         print(f"\n📝 Test {i}: {question}")
         print("-" * 40)
         
         try:
-            result = await run_multi_agent_system(question)
-            
             if "error" in result:
                 print(f"❌ Error: {result['error']}")
             else:
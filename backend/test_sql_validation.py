@@ -0,0 +1,64 @@
+import sys
+import os
+
+# Add the app directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+
+from core.multi_agent_orchestrator import TableDataManager, parse_statements, validate_sql
+
+SALES_DETAILS_COLUMNS = [
+    'CheckId', 'Date', 'Month', 'Year', 'DayPart', 'RevenueCenter', 'CategoryId', 'Covers',
+    'GrossAmount', 'NetAmount', 'DiscountAmount', 'SiteCode', 'CompanyCode'
+]
+
+# The specialist prompt's own "Sales with CategoryName" pattern for Vw_SI_SalesDetails
+CATEGORY_JOIN_SQL = (
+    "SELECT TOP 100 cd.CategoryName, FORMAT(SUM(main.NetAmount), 'N0', 'en-GB') AS TotalNetAmount, "
+    "FORMAT(SUM(main.GrossAmount), 'N0', 'en-GB') AS TotalGrossAmount, "
+    "FORMAT(SUM(main.DiscountAmount), 'N0', 'en-GB') AS TotalDiscountAmount, main.Year "
+    "FROM dbo.Vw_SI_SalesDetails main INNER JOIN dbo.Vw_SI_CategoryDetails cd ON main.CategoryId = cd.CategoryId "
+    "WHERE main.Year = 2025 AND main.CompanyCode = 'C1587' AND main.SiteCode = 'L2312' "
+    "GROUP BY cd.CategoryName, main.Year ORDER BY TotalNetAmount DESC"
+)
+
+def make_table_manager():
+    """A TableDataManager seeded with the sales details schema, so no database is needed"""
+    table_manager = TableDataManager()
+    table_manager.load_snapshot({
+        'Vw_SI_SalesDetails': {
+            'schema': [{'name': name, 'type': 'nvarchar', 'nullable': 'YES', 'default': None} for name in SALES_DETAILS_COLUMNS],
+            'sample_data': []
+        }
+    })
+    return table_manager
+
+def test_prompt_category_join_is_valid():
+    """The JOIN the prompt asks for must pass validation unchanged"""
+    sql_query, error, code = validate_sql(CATEGORY_JOIN_SQL, make_table_manager())
+    assert error is None, error
+    assert code is None
+    assert sql_query == CATEGORY_JOIN_SQL
+
+def test_unknown_table_is_rejected():
+    """Tables neither configured nor named by the prompts are still rejected"""
+    _, error, code = validate_sql("SELECT TOP 10 * FROM dbo.SomeOtherTable", make_table_manager())
+    assert code == "INVALID_SQL"
+    assert "SomeOtherTable" in error
+
+def test_unknown_column_is_rejected():
+    """Columns missing from a configured table's schema are still rejected"""
+    _, error, code = validate_sql("SELECT TOP 10 NoSuchColumn FROM dbo.Vw_SI_SalesDetails", make_table_manager())
+    assert code == "INVALID_SQL"
+    assert "NoSuchColumn" in error
+
+def test_untokenizable_statement_is_left_to_server():
+    """Tokenizer failures (unterminated quote or bracket) map to None instead of raising"""
+    assert parse_statements(["SELECT TOP 10 * FROM dbo.Vw_SI_SalesDetails WHERE Month = 'May"]) == [None]
+    assert parse_statements(["SELECT TOP 10 [NetAmount FROM dbo.Vw_SI_SalesDetails"]) == [None]
+
+if __name__ == "__main__":
+    for test in (test_prompt_category_join_is_valid, test_unknown_table_is_rejected,
+                 test_unknown_column_is_rejected, test_untokenizable_statement_is_left_to_server):
+        test()
+        print(f"✅ {test.__name__}")
+    print("\n🎉 SQL validation tests passed!")
@@ -3,10 +3,45 @@
 Test script to verify SQL Server connection
 """
 
+import asyncio
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
 
+async def test_connection(pyodbc, conn_str):
+    """Run the connection checks with every blocking pyodbc call off the event loop"""
+    print("Attempting to connect...")
+    # Autocommit: the checks below only read, so no transaction is opened on the server
+    conn = await asyncio.to_thread(pyodbc.connect, conn_str, autocommit=True)
+    cursor = conn.cursor()
+    
+    # Test basic connection
+    await asyncio.to_thread(cursor.execute, "SELECT 1 as test")
+    result = await asyncio.to_thread(cursor.fetchone)
+    print(f"Connection test result: {result}")
+    
+    # Test querying the available tables: one metadata query covers every table, and no row data is transferred.
+    # INFORMATION_SCHEMA only lists objects the login can access, so a missing table is also an access error.
+    tables = ['Vw_SI_SalesDetails', 'Vw_SI_SalesSummary', 'View_DiscountDetails']
+    placeholders = ", ".join("?" for _ in tables)
+    
+    await asyncio.to_thread(
+        cursor.execute,
+        "SELECT TABLE_NAME, COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS "
+        f"WHERE TABLE_NAME IN ({placeholders}) GROUP BY TABLE_NAME",
+        *tables
+    )
+    column_counts = dict(await asyncio.to_thread(cursor.fetchall))
+    
+    for table in tables:
+        if table in column_counts:
+            print(f"✓ Successfully queried {table}: {column_counts[table]} columns")
+        else:
+            print(f"✗ Error querying {table}: table not found or not accessible")
+    
+    cursor.close()
+    conn.close()
+
 try:
     import pyodbc
     from app.core.config import SERVER, DATABASE, USERNAME, PASSWORD
@@ -23,28 +58,7 @@ try:
         f"UID={USERNAME};PWD={PASSWORD};TrustServerCertificate=yes;"
     )
     
-    print("Attempting to connect...")
-    conn = pyodbc.connect(conn_str)
-    cursor = conn.cursor()
-    
-    # Test basic connection
-    cursor.execute("SELECT 1 as test")
-    result = cursor.fetchone()
-    print(f"Connection test result: {result}")
-    
-    # Test querying the available tables
-    tables = ['Vw_SI_SalesDetails', 'Vw_SI_SalesSummary', 'View_DiscountDetails']
-    
-    for table in tables:
-        try:
-            cursor.execute(f"SELECT TOP 1 * FROM {table}")
-            result = cursor.fetchone()
-            print(f"✓ Successfully queried {table}: {len(result)} columns")
-        except Exception as e:
-            print(f"✗ Error querying {table}: {e}")
-    
-    cursor.close()
-    conn.close()
+    asyncio.run(test_connection(pyodbc, conn_str))
     print("✓ SQL Server connection test completed successfully!")
     
 except ImportError as e:
@@ -52,4 +66,4 @@ except ImportError as e:
     print("Please install required packages: pip install pyodbc")
 except Exception as e:
     print(f"Connection error: {e}")
-    print("Please check your SQL Server connection details and ensure the server is accessible.") 
\ No newline at end of file
+    print("Please check your SQL Server connection details and ensure the server is accessible.") 
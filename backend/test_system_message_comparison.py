@@ -1,13 +1,19 @@
 import asyncio
+import re
 import sys
 import os
 
 # Add the app directory to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
 
-from core.multi_agent_orchestrator import TableSpecialistAgent, TableDataManager
+from core.multi_agent_orchestrator import TableSpecialistAgent, get_table_manager
 from core.sqlserver_query_generator import generate_dynamic_prompt_template
 
+def find_keywords(keywords, text):
+    """Return the keywords that occur in text, found in a single scan with one alternation pattern"""
+    pattern = re.compile("|".join(map(re.escape, keywords)))
+    return set(pattern.findall(text))
+
 def compare_system_messages():
     """Compare the system messages between original and multi-agent systems"""
     
@@ -32,8 +38,8 @@ def compare_system_messages():
     print("\n📝 MULTI-AGENT SYSTEM MESSAGE (multi_agent_orchestrator.py):")
     print("-" * 40)
     
-    # Create a test table context
-    table_manager = TableDataManager()
+    # Create a test table context (the shared manager is reused instead of building a new one per run)
+    table_manager = get_table_manager()
     test_context = {
         'table_name': 'Vw_SI_SalesSummary',
         'description': 'Summary sales data and metrics',
@@ -87,36 +93,40 @@ def compare_system_messages():
         "EXAMPLE INCORRECT OUTPUT"
     ]
     
+    # Each prompt is scanned once for all of its keywords
+    found_original = find_keywords(original_keywords, original_prompt)
+    found_multi_agent = find_keywords(multi_agent_keywords, multi_agent_prompt)
+    
     print("Original System Message Keywords:")
     for keyword in original_keywords:
-        status = "✅" if keyword in original_prompt else "❌"
+        status = "✅" if keyword in found_original else "❌"
         print(f"  {status} {keyword}")
     
     print("\nMulti-Agent System Message Keywords:")
     for keyword in multi_agent_keywords:
-        status = "✅" if keyword in multi_agent_prompt else "❌"
+        status = "✅" if keyword in found_multi_agent else "❌"
         print(f"  {status} {keyword}")
     
     # Check if multi-agent uses the same comprehensive approach
     print("\n🎯 VERIFICATION:")
     print("-" * 40)
     
-    if "domain-specific SQL assistant for Paperchase" in multi_agent_prompt:
+    if "domain-specific SQL assistant for Paperchase" in found_multi_agent:
         print("✅ Multi-agent uses the same domain-specific approach")
     else:
         print("❌ Multi-agent does NOT use the same domain-specific approach")
     
-    if "CRITICAL OUTPUT RULES" in multi_agent_prompt:
+    if "CRITICAL OUTPUT RULES" in found_multi_agent:
         print("✅ Multi-agent uses the same critical output rules")
     else:
         print("❌ Multi-agent does NOT use the same critical output rules")
     
-    if "EXAMPLE CORRECT OUTPUT" in multi_agent_prompt:
+    if "EXAMPLE CORRECT OUTPUT" in found_multi_agent:
         print("✅ Multi-agent uses the same example format")
     else:
         print("❌ Multi-agent does NOT use the same example format")
     
-    if "SQL Server (T-SQL)" in multi_agent_prompt:
+    if "SQL Server (T-SQL)" in found_multi_agent:
         print("✅ Multi-agent uses the same SQL Server focus")
     else:
         print("❌ Multi-agent does NOT use the same SQL Server focus")